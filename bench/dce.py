@@ -0,0 +1,65 @@
+"""
+    What dead code elimination (dead_code.py) takes out: every .c file given
+    (test_dir/source by default) and --generated synthetic programs are
+    compiled with and without --no-dce, the .bss slots and the instructions
+    of both outputs and the operations and blocks the pass removed are
+    printed.
+
+    usage: python bench/dce.py [files or directories] [--generated N] [backend options]
+
+    The parser has to be generated first (gen.bat) unless --frontend pratt is given.
+"""
+import os
+import io
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from compile import compile_source, collect_sources, add_backend_arguments, backend_options
+from profiler import Profiler
+from generate import ProgramGenerator
+
+def counters(source, options):
+    profiler = Profiler(memory=False)
+    compile_source(source, io.StringIO(), profiler=profiler, **options)
+    return profiler.counters
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='.bss slots and instructions dead code elimination removes')
+    arg_parser.add_argument('sources', nargs='*',
+                            default=[os.path.join(BENCH_DIR, '..', 'test_dir', 'source')])
+    arg_parser.add_argument('--generated', type=int, default=20,
+                            help='synthetic programs to compile besides the sources (default: 20)')
+    add_backend_arguments(arg_parser)
+    args    = arg_parser.parse_args(argv[1:])
+    options = backend_options(args)
+
+    sources = collect_sources(args.sources)
+    with tempfile.TemporaryDirectory() as directory:
+        for seed in range(args.generated):
+            path = os.path.join(directory, f'generated_{seed}.c')
+            with open(path, 'w') as program:
+                program.write(ProgramGenerator(40 + 10 * seed, 2 + seed % 8, 1 + seed % 3, 1 + seed % 3, seed).program())
+            sources.append(path)
+
+        columns = ('bss_slots', 'instructions')
+        totals  = {(column, dce): 0 for column in columns for dce in (False, True)}
+        print(f'{"source":<24} {"slots":>7} {"dce":>5} {"instructions":>13} {"dce":>6} {"operations":>11} {"blocks":>7}')
+        for source in sources:
+            results = {dce: counters(source, dict(options, dce=dce)) for dce in (False, True)}
+            for key in totals:
+                totals[key] += results[key[1]][key[0]]
+            print(f'{os.path.basename(source):<24} {results[False]["bss_slots"]:>7} {results[True]["bss_slots"]:>5} '
+                  f'{results[False]["instructions"]:>13} {results[True]["instructions"]:>6} '
+                  f'{results[True]["dead_operations"]:>11} {results[True]["empty_blocks"]:>7}')
+    print(f'removed {totals["bss_slots", False] - totals["bss_slots", True]} of {totals["bss_slots", False]} .bss slots, '
+          f'{totals["instructions", False] - totals["instructions", True]} of {totals["instructions", False]} instructions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
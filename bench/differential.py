@@ -0,0 +1,99 @@
+"""
+    Differential check of the optimization passes: every .c file given
+    (test_dir/source by default) and --generated synthetic programs, some
+    of them with loops that never run put in (the shape SCCP removes), are
+    compiled with all the passes on and with each of them off (the --no-*
+    options) and once with all of them off. The outputs are run by
+    interpreter.py, the value main returns has to be the same in every
+    run (a program still running after --max-steps instructions has to be
+    in every run). Prints a line per program, exits with 1 when a run
+    differs or fails.
+
+    usage: python bench/differential.py [files or directories] [--generated N] [--max-steps N] [backend options]
+
+    The parser has to be generated first (gen.bat) unless --frontend pratt is given.
+"""
+import os
+import io
+import sys
+import random
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from compile import compile_source, collect_sources, add_backend_arguments, backend_options
+from interpreter import Program, Machine, ExecutionError
+from generate import ProgramGenerator
+
+PASSES = ['constants', 'licm', 'strength', 'dce', 'cse']
+
+def with_dead_loops(program, seed):
+    """`program` with 1-3 loops on a condition false from the start put between its statements"""
+    rnd     = random.Random(seed)
+    lines   = program.splitlines()
+    places  = [i + 1 for i, line in enumerate(lines) if line.startswith('    v')]
+    live    = sum(line.startswith('    int v') for line in lines)
+    for place in sorted(rnd.sample(places, min(len(places), rnd.randint(1, 3))), reverse=True):
+        variable = f'v{rnd.randrange(live)}'
+        lines[place:place] = [f'    while (K > {rnd.randint(7, 20)}) {{',
+                              f'        {variable} = {variable} + {rnd.randint(1, 9)};', '    }']
+    return '\n'.join(lines) + '\n'
+
+
+def result(source, options, max_steps):
+    """the value main returns, 'running' past `max_steps` or the error compiling or running it"""
+    output  = io.StringIO()
+    machine = None
+    try:
+        compile_source(source, output, **options)
+        machine = Machine(Program(output.getvalue()))
+        return machine.run(max_steps)['result']
+    except ExecutionError as error:
+        if machine is not None and machine.counts['instructions'] >= max_steps:
+            return 'running'
+        return f'error: {error.message}'
+    except Exception as error:
+        return f'error: {type(error).__name__}: {error}'
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='results of programs with and without each optimization pass')
+    arg_parser.add_argument('sources', nargs='*',
+                            default=[os.path.join(BENCH_DIR, '..', 'test_dir', 'source')])
+    arg_parser.add_argument('--generated', type=int, default=40,
+                            help='synthetic programs to run besides the sources, every other one '
+                                 'with loops that never run (default: 40)')
+    arg_parser.add_argument('--max-steps', type=int, default=10 ** 6,
+                            help='instructions a run may execute (default: 10**6)')
+    add_backend_arguments(arg_parser)
+    args    = arg_parser.parse_args(argv[1:])
+    options = backend_options(args)
+
+    runs    = [('all', options)] + [(f'no-{name}', dict(options, **{name: False})) for name in PASSES]
+    runs   += [('none', dict(options, **dict.fromkeys(PASSES, False)))]
+    sources = collect_sources(args.sources)
+    different = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for seed in range(args.generated):
+            program = ProgramGenerator(20 + 5 * seed, 2 + seed % 6, 1 + seed % 3, 1 + seed % 2, seed).program()
+            path    = os.path.join(directory, f'generated_{seed}.c')
+            with open(path, 'w') as text:
+                text.write(with_dead_loops(program, seed) if seed % 2 else program)
+            sources.append(path)
+
+        print(f'{"source":<24} {"result":>12}  differing runs')
+        for source in sources:
+            results = {name: result(source, run_options, args.max_steps) for name, run_options in runs}
+            failed  = [name for name, value in results.items()
+                       if value != results['none'] or str(value).startswith('error')]
+            different += bool(failed)
+            print(f'{os.path.basename(source):<24} {str(results["none"]):>12}  '
+                  + (', '.join(f'{name}: {results[name]}' for name in failed) or '-'))
+    print(f'{different} of {len(sources)} programs differ')
+    return 1 if different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,65 @@
+"""
+    The hand-written parser (pratt.py) against the one ANTLR generates: every
+    .c file given (test_dir/source by default) and --generated synthetic
+    programs are compiled with both frontends, the .asm has to be the same
+    and the parse phase times are printed; the first ANTLR parse includes
+    importing its runtime. Exits with 1 when an output differs.
+
+    usage: python bench/frontends.py [files or directories] [--generated N]
+
+    The parser has to be generated first (gen.bat).
+"""
+import os
+import io
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from compile import compile_source, collect_sources
+from profiler import Profiler
+from generate import ProgramGenerator
+
+def compile_with(source, frontend):
+    """(.asm text, seconds of the parse phase)"""
+    output      = io.StringIO()
+    profiler    = Profiler(memory=False)
+    compile_source(source, output, profiler=profiler, frontend=frontend)
+    return output.getvalue(), profiler.phases['parse']['seconds']
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='compares the ANTLR and the Pratt frontends')
+    arg_parser.add_argument('sources', nargs='*',
+                            default=[os.path.join(BENCH_DIR, '..', 'test_dir', 'source')])
+    arg_parser.add_argument('--generated', type=int, default=20,
+                            help='synthetic programs to compare besides the sources (default: 20)')
+    args = arg_parser.parse_args(argv[1:])
+
+    sources = collect_sources(args.sources)
+    with tempfile.TemporaryDirectory() as directory:
+        for seed in range(args.generated):
+            path = os.path.join(directory, f'generated_{seed}.c')
+            with open(path, 'w') as program:
+                program.write(ProgramGenerator(40 + 10 * seed, 2 + seed % 8, 1 + seed % 3, 1 + seed % 3, seed).program())
+            sources.append(path)
+
+        different   = 0
+        totals      = {'antlr': 0.0, 'pratt': 0.0}
+        print(f'{"source":<32} {"antlr, s":>10} {"pratt, s":>10}  same')
+        for source in sources:
+            results = {frontend: compile_with(source, frontend) for frontend in totals}
+            same    = results['antlr'][0] == results['pratt'][0]
+            different += not same
+            for frontend in totals:
+                totals[frontend] += results[frontend][1]
+            print(f'{os.path.basename(source):<32} {results["antlr"][1]:>10.4f} {results["pratt"][1]:>10.4f}  '
+                  f'{"yes" if same else "NO"}')
+    print(f'{"total":<32} {totals["antlr"]:>10.4f} {totals["pratt"]:>10.4f}  {len(sources) - different}/{len(sources)}')
+    return 1 if different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,79 @@
+"""
+    Synthetic programs in the supported C subset.
+
+    usage: python bench/generate.py [statements] [live] [depth] [expr_depth] [seed] > program.c
+"""
+import sys
+import random
+
+
+class ProgramGenerator:
+    """
+        statements  - number of assignments in main
+        live        - number of variables, all of them stay alive until the
+                      final return
+        depth       - while-nesting depth, every loop runs a few iterations
+                      on its own counter, so the programs terminate
+        expr_depth  - depth of the expression trees on the right-hand sides
+    """
+
+    def __init__(self, statements=100, live=8, depth=1, expr_depth=2, seed=0):
+        self.statements = statements
+        self.live       = max(live, 1)
+        self.depth      = depth
+        self.expr_depth = expr_depth
+        self.random     = random.Random(seed)
+        self.loops      = 0
+
+    def operand(self):
+        if self.random.random() < 0.25:
+            return str(self.random.randint(0, 9))
+        return f'v{self.random.randrange(self.live)}'
+
+    def expression(self, depth):
+        """a full tree of `depth` levels, divisions by literals only"""
+        if depth == 0:
+            return self.operand()
+        operator = self.random.choice('+-*+-/')
+        left     = self.expression(depth - 1)
+        if operator == '/':
+            return f'({left} / {self.random.randint(1, 9)})'
+        return f'({left} {operator} {self.expression(depth - 1)})'
+
+    def assignment(self):
+        return f'v{self.random.randrange(self.live)} = {self.expression(self.expr_depth)};'
+
+    def block(self, count, depth, indent):
+        """`count` assignments with loops nested `depth` deep in the middle"""
+        pad = '    ' * indent
+        if depth == 0 or count < 3:
+            return [pad + self.assignment() for _ in range(count)]
+        inner   = count // 2
+        before  = (count - inner) // 2
+        after   = count - inner - before
+        counter = f'l{self.loops}'
+        self.loops += 1
+        lines   = [pad + self.assignment() for _ in range(before)]
+        lines  += [pad + f'{counter} = 0;', pad + f'while ({counter} < {self.random.randint(2, 4)}) {{']
+        lines  += self.block(inner, depth - 1, indent + 1)
+        lines  += [pad + f'    {counter} = {counter} + 1;', pad + '}']
+        lines  += [pad + self.assignment() for _ in range(after)]
+        return lines
+
+    def program(self):
+        self.loops = 0
+        body    = self.block(self.statements, self.depth, 1)
+        lines   = ['int const K = 7;', '', 'int main() {']
+        lines  += [f'    int v{i} = {self.random.randint(0, 9)};' for i in range(self.live)]
+        lines  += [f'    int l{i};' for i in range(self.loops)]
+        lines  += body
+        lines  += ['    return ' + ' + '.join(f'v{i}' for i in range(self.live)) + ';', '}', '']
+        return '\n'.join(lines)
+
+
+def main(argv):
+    knobs = [int(arg) for arg in argv[1:6]]
+    sys.stdout.write(ProgramGenerator(*knobs).program())
+
+if __name__ == '__main__':
+    main(sys.argv)
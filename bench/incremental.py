@@ -0,0 +1,89 @@
+"""
+    Recompiling a file after an edit to one of its functions: a synthetic
+    file of --functions functions (the programs of generate.py, every one
+    but the first renamed) is compiled once to fill a FunctionCache, then
+    one function at a time is edited and the file compiled again with the
+    cache. The seconds of the phases after parsing (what the cache saves)
+    of the cold and the warm compilations and the functions taken from the
+    cache are printed, the warm .asm has to be the one a compilation
+    without the cache gives. Exits with 1 when it differs.
+
+    usage: python bench/incremental.py [--functions N] [--statements N] [--edits N] [backend options]
+
+    The parser has to be generated first (gen.bat) unless --frontend pratt is given.
+"""
+import os
+import io
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from compile import compile_source, add_backend_arguments, backend_options
+from profiler import Profiler
+from function_cache import FunctionCache
+from generate import ProgramGenerator
+
+def functions(count, statements):
+    """bodies of `count` functions, the lines of each one without the global constant"""
+    bodies = []
+    for i in range(count):
+        lines = ProgramGenerator(statements, 2 + i % 8, 1 + i % 3, 1 + i % 3, i).program().splitlines()[2:]
+        if i:
+            lines[0] = f'int f{i}() {{'
+        bodies.append(lines)
+    return bodies
+
+
+def source_text(bodies):
+    return '\n'.join(['int const K = 7;', ''] + [line for lines in bodies for line in lines]) + '\n'
+
+
+def compile_with(path, options, cache=None):
+    """(.asm text, seconds of the phases after parsing, functions taken from the cache)"""
+    output      = io.StringIO()
+    profiler    = Profiler(memory=False)
+    compile_source(path, output, profiler=profiler, cache=cache, **options)
+    seconds     = sum(record['seconds'] for phase, record in profiler.phases.items() if phase != 'parse')
+    return output.getvalue(), seconds, profiler.counters.get('cached_functions', 0)
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='recompilation of a file after an edit to one function')
+    arg_parser.add_argument('--functions', type=int, default=16, help='functions in the file (default: 16)')
+    arg_parser.add_argument('--statements', type=int, default=60, help='assignments in a function (default: 60)')
+    arg_parser.add_argument('--edits', type=int, default=4, help='functions edited one after another (default: 4)')
+    add_backend_arguments(arg_parser)
+    args    = arg_parser.parse_args(argv[1:])
+    options = backend_options(args)
+
+    bodies  = functions(args.functions, args.statements)
+    cache   = FunctionCache()
+    different = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'functions.c')
+        with open(path, 'w') as program:
+            program.write(source_text(bodies))
+        _, cold, _ = compile_with(path, options, cache)
+        print(f'{"edit":<10} {"cold, s":>8} {"warm, s":>8} {"cached":>7}  same')
+        print(f'{"-":<10} {cold:>8.3f} {"":>8} {0:>7}')
+
+        for edit in range(args.edits):
+            edited = (edit * 5 + 1) % args.functions
+            bodies[edited].insert(-2, f'    v0 = v0 + {edit + 1};')
+            with open(path, 'w') as program:
+                program.write(source_text(bodies))
+            code, warm, cached  = compile_with(path, options, cache)
+            fresh, cold, _      = compile_with(path, options)
+            same = code == fresh
+            different += not same
+            name = 'main' if edited == 0 else f'f{edited}'
+            print(f'{name:<10} {cold:>8.3f} {warm:>8.3f} {cached:>4}/{args.functions}  {"yes" if same else "NO"}')
+    print(f'cache: {cache.hits} hits, {cache.misses} misses')
+    return 1 if different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
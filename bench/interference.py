@@ -0,0 +1,92 @@
+"""
+    Interference graph construction: the bit matrix and the NumPy matrix
+    against the original adjacency-list version on a synthetic function.
+
+    usage: python bench/interference.py [webs] [live]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tokens import Variable, Integer, EAX, Assign, ADD
+from operation_utils import BasicBlock, DUGraph, DUChain, Web, InterferenceGraph, numpy
+
+
+class ListInterferenceGraph:
+    """the original adjacency-list construction, kept for comparison"""
+
+    def __init__(self, graph: DUGraph, webs: list):
+        owners      = Web.chain_webs(webs)
+        adj_list    = {i: [] for i in range(len(webs))}
+        for node in range(len(graph)):
+            current_webs = set([owners[chain_idx] for chain_idx in graph.live(node)])
+            for web_1 in current_webs:
+                for web_2 in current_webs:
+                    if web_1 == web_2:
+                        continue
+                    if web_2 not in adj_list[web_1]:
+                        adj_list[web_1].append(web_2)
+                        adj_list[web_2].append(web_1)
+        self.adj_list = adj_list
+
+
+def synthetic_function(webs: int, live: int):
+    """
+        Straight-line code where every variable is defined once and used
+        `live` statements later, so about `live` webs are alive at any point
+    """
+    eax         = EAX()
+    block       = BasicBlock()
+    variables   = [Variable(f'v{i}') for i in range(webs)]
+    for i, var in enumerate(variables):
+        block.add(Assign(var, Integer(i), eax))
+        if i >= live:
+            block.add(ADD(variables[i - live], variables[i - live + 1], eax))
+    for i in range(max(webs - live, 0), webs):
+        block.add(ADD(variables[i], variables[i], eax))
+    return block
+
+
+def measure(build):
+    """wall time of an untraced run and tracemalloc peak of a second one"""
+    start   = time.perf_counter()
+    graph   = build()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    build()
+    peak    = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return graph, elapsed, peak
+
+
+def main(argv):
+    webs_count  = int(argv[1]) if len(argv) > 1 else 5000
+    live        = int(argv[2]) if len(argv) > 2 else 64
+
+    du_graph = DUGraph.from_flowgraph([synthetic_function(webs_count, live)])
+    webs     = Web.from_chains(DUChain.build_chains(du_graph))
+
+    variants = [
+        ('lists',  lambda: ListInterferenceGraph(du_graph, webs)),
+        ('bits',   lambda: InterferenceGraph(du_graph, webs, dense=False)),
+    ]
+    if numpy is not None:
+        variants.append(('numpy', lambda: InterferenceGraph(du_graph, webs, dense=True)))
+
+    print(f'webs: {len(webs)}, live: {live}')
+    reference = None
+    for name, build in variants:
+        graph, elapsed, peak = measure(build)
+        adjacency = {vertex: sorted(graph.adj_list[vertex]) for vertex in graph.adj_list}
+        if reference is None:
+            reference = adjacency
+        assert adjacency == reference, f'{name} differs from lists'
+        print(f'{name:>8}: {elapsed * 1000:10.1f} ms {peak / 2 ** 20:10.2f} MiB peak')
+
+
+if __name__ == '__main__':
+    main(sys.argv)
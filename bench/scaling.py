@@ -0,0 +1,180 @@
+"""
+    Scaling of the compiler phases on synthetic programs (bench/generate.py).
+
+    Every sweep grows one knob of the generator with the others fixed, times
+    each phase (best of --repeat untraced runs), measures its tracemalloc
+    peak in one more run and fits seconds = a * knob ** b by least squares
+    on the logarithms. Times are compared relative to a calibration loop. The results are compared with a stored baseline: the
+    run fails when a phase got slower, needs more memory or scales worse
+    than the baseline by more than the threshold.
+
+    usage: python bench/scaling.py [--baseline FILE] [--update] [--threshold 0.5] [--repeat 3]
+
+    The parser has to be generated first (gen.bat). Wall times depend on the
+    machine, record the baseline with --update where the benchmark runs.
+"""
+import os
+import io
+import gc
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from compile import compile_source
+from profiler import Profiler
+from generate import ProgramGenerator
+
+# sweep -> (knob values, fixed generator arguments)
+SWEEPS = {
+    'statements':   ([50, 100, 200, 400],   dict(live=8, depth=1, expr_depth=2)),
+    'live':         ([4, 8, 16, 32],        dict(statements=200, depth=1, expr_depth=2)),
+    'depth':        ([1, 2, 3, 4],          dict(statements=200, live=8, expr_depth=2)),
+    'expr_depth':   ([1, 2, 3, 4],          dict(statements=100, live=8, depth=1)),
+}
+
+MIN_SECONDS     = 0.02                      # faster phases are too noisy to compare
+MIN_BYTES       = 64 * 1024
+MAX_EXPONENT    = 0.3                       # allowed growth of a fitted exponent of a slow phase
+
+
+def calibrate(repeat=5):
+    """
+        seconds of a fixed pure-Python workload, times are compared in these
+        units so that a busy or slower machine doesn't look like a regression
+    """
+    best = None
+    for _ in range(repeat):
+        start   = time.perf_counter()
+        table   = {}
+        for i in range(200000):
+            table[i % 1000] = table.get(i % 1000, 0) + i
+        elapsed = time.perf_counter() - start
+        best    = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def profile(path, memory, repeat=1):
+    """phase -> record of the best of `repeat` compilations, and the counters"""
+    best = {}
+    for _ in range(repeat):
+        profiler = Profiler(memory=memory)
+        gc.collect()
+        gc.disable()                        # like timeit, collections land in random phases
+        try:
+            compile_source(path, io.StringIO(), profiler=profiler)
+        finally:
+            gc.enable()
+            profiler.stop()
+        for phase, record in profiler.phases.items():
+            if phase not in best or record['seconds'] < best[phase]['seconds']:
+                best[phase] = record
+    return best, profiler.counters
+
+
+def fit(xs, ys):
+    """(a, b) of y = a * x ** b"""
+    points  = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    if len(points) < 2:
+        return 0.0, 0.0
+    mean_x  = sum(x for x, _ in points) / len(points)
+    mean_y  = sum(y for _, y in points) / len(points)
+    spread  = sum((x - mean_x) ** 2 for x, _ in points)
+    b       = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else 0.0
+    return math.exp(mean_y - b * mean_x), b
+
+
+def run_sweep(name, repeat):
+    values, fixed = SWEEPS[name]
+    points = []
+    unit   = calibrate()
+    with tempfile.TemporaryDirectory() as directory:
+        for value in values:
+            path = os.path.join(directory, f'{name}_{value}.c')
+            with open(path, 'w') as source:
+                source.write(ProgramGenerator(**dict(fixed, **{name: value})).program())
+            times, counters = profile(path, memory=False, repeat=repeat)
+            memory, _       = profile(path, memory=True)
+            points.append((value, times, memory, counters))
+
+    result = {}
+    for phase in points[-1][1]:
+        seconds = [times[phase]['seconds'] for _, times, _, _ in points]
+        a, b    = fit(values, seconds)
+        result[phase] = {'exponent': round(b, 3), 'coefficient': a,
+                         'seconds': seconds[-1], 'peak_bytes': points[-1][2][phase]['peak_bytes']}
+    result['counters']      = points[-1][3]
+    result['calibration']   = unit
+    return result
+
+
+def regressions(results, baseline, threshold):
+    found = []
+    for sweep, phases in results.items():
+        if sweep not in baseline:
+            continue
+        # baseline times scaled to the speed of this machine now
+        scale = phases['calibration'] / baseline[sweep].get('calibration', phases['calibration'])
+        for phase, record in phases.items():
+            base = baseline[sweep].get(phase)
+            if phase in ('counters', 'calibration') or base is None:
+                continue
+            expected = base['seconds'] * scale
+            if record['seconds'] > max(expected, MIN_SECONDS) * (1 + threshold):
+                found.append(f'{sweep}/{phase}: {record["seconds"]:.4f}s against {expected:.4f}s')
+            if record['peak_bytes'] > max(base['peak_bytes'], MIN_BYTES) * (1 + threshold):
+                found.append(f'{sweep}/{phase}: peak {record["peak_bytes"]} B against {base["peak_bytes"]} B')
+            if record['seconds'] > MIN_SECONDS and record['exponent'] > base['exponent'] + MAX_EXPONENT:
+                found.append(f'{sweep}/{phase}: grows as knob ** {record["exponent"]} '
+                             f'against knob ** {base["exponent"]}')
+    return found
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='compiler phase scaling benchmark')
+    arg_parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    arg_parser.add_argument('--update', action='store_true', help='store the results as the baseline')
+    arg_parser.add_argument('--threshold', type=float, default=0.5,
+                            help='allowed relative growth of time and memory (default: 0.5)')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--sweep', action='append', choices=list(SWEEPS),
+                            help='run only these sweeps')
+    args = arg_parser.parse_args(argv[1:])
+
+    results = {}
+    for name in args.sweep or SWEEPS:
+        results[name] = run_sweep(name, args.repeat)
+        values = SWEEPS[name][0]
+        print(f'\n{name} {values[0]}..{values[-1]}:')
+        for phase, record in results[name].items():
+            if phase not in ('counters', 'calibration'):
+                print(f'  {phase:<14}{record["seconds"]:>10.4f} s{record["peak_bytes"]:>12} B'
+                      f'    ~ knob ** {record["exponent"]}')
+        print(f'  counters: {results[name]["counters"]}')
+
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=4)
+        print(f'\nbaseline saved to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        raise SystemExit(f'No baseline at {args.baseline}, run with --update first')
+    with open(args.baseline) as file:
+        found = regressions(results, json.load(file), args.threshold)
+    for line in found:
+        print('REGRESSION', line)
+    sys.exit(1 if found else 0)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -4,8 +4,7 @@ rem Compile .c files into .asm files
 
 cd src
 
-FOR /R ..\test_dir\source %%f IN (*.c) DO (
-	python compile.py "../test_dir/source/%%~nxf" > "..\test_dir\compiled\%%~nf.asm"
-)
+rem all files are compiled by one python process
+python compile.py ..\test_dir\source -o ..\test_dir\compiled
 
 cd ..
\ No newline at end of file
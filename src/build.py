@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import io
+from concurrent.futures import ProcessPoolExecutor
+from compile import add_backend_arguments, backend_options, collect_sources, output_path
+
+SOURCE_DIR  = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR     = os.path.join(os.path.dirname(SOURCE_DIR), 'C.g4')
+
+
+def parse_args(argv):
+    arg_parser = argparse.ArgumentParser(description='parallel C subset -> NASM build with an output cache')
+    arg_parser.add_argument('sources', nargs='+',
+                            help='.c files or directories with .c files to compile')
+    arg_parser.add_argument('-o', '--output-dir', required=True,
+                            help='directory for .asm files, the layout of the source tree is kept')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                            help='number of compiler processes (default: number of cores)')
+    arg_parser.add_argument('--cache-dir',
+                            help='directory of the output cache (default: OUTPUT_DIR/.cache)')
+    arg_parser.add_argument('--cache-size', type=float, default=256,
+                            help='cache size limit in megabytes, least recently used entries '
+                                 'are dropped first (default: 256)')
+    add_backend_arguments(arg_parser)
+    return arg_parser.parse_args(argv)
+
+
+def compiler_digest(options):
+    """
+        hash of everything the output depends on besides the source:
+        the grammar, every compiler module and the back-end options
+    """
+    digest = hashlib.sha256()
+    paths  = [GRAMMAR] + sorted(os.path.join(SOURCE_DIR, name) for name in os.listdir(SOURCE_DIR)
+                                if name.endswith('.py'))
+    for path in paths:
+        if os.path.isfile(path):
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """
+        .asm files on disk named by the key of their input, the access time
+        is kept in the mtime of an entry and the oldest entries are removed
+        when the total size exceeds `limit` bytes
+    """
+
+    def __init__(self, directory, limit):
+        self.directory  = directory
+        self.limit      = limit
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, compiler):
+        with open(source, 'rb') as file:
+            return hashlib.sha256(compiler.encode() + file.read()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.asm')
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as entry:
+                code = entry.read()
+        except OSError:
+            return None
+        os.utime(self.path(key))
+        return code
+
+    def put(self, key, code):
+        temporary = self.path(key) + f'.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as entry:
+            entry.write(code)
+        os.replace(temporary, self.path(key))
+
+    def evict(self):
+        """removes least recently used entries over the limit, returns their number"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.asm'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total   = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in entries:
+            if total <= self.limit:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total   -= size
+            removed += 1
+        return removed
+
+
+def compile_job(source, options):
+    """runs in a worker process: (asm bytes, None) or (None, error message)"""
+    from compile import compile_source
+    output = io.StringIO()
+    try:
+        compile_source(source, output, **options)
+    except Exception as error:
+        return None, str(getattr(error, 'message', error))
+    return output.getvalue().encode(), None
+
+
+def up_to_date(path, code):
+    try:
+        with open(path, 'rb') as asm:
+            return asm.read() == code
+    except OSError:
+        return False
+
+
+def write_output(path, code):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as asm:
+        asm.write(code)
+
+
+def build(roots, output_dir, jobs=None, cache_dir=None, cache_size=256 * 2 ** 20, **options):
+    """
+        compiles the .c files under `roots` into `output_dir`, only sources
+        missing from the cache are compiled, in `jobs` processes.
+        Returns {'compiled', 'restored', 'up to date', 'failed', 'evicted'} counts.
+    """
+    cache    = OutputCache(cache_dir or os.path.join(output_dir, '.cache'), cache_size)
+    compiler = compiler_digest(options)
+    stats    = dict.fromkeys(['compiled', 'restored', 'up to date', 'failed', 'evicted'], 0)
+
+    pending  = []                                   # (source, output path, cache key)
+    owners   = {}                                   # output path -> source writing it
+    for root in roots:
+        base = root if os.path.isdir(root) else None
+        for source in collect_sources([root]):
+            path  = output_path(source, output_dir, base)
+            owner = owners.setdefault(os.path.normcase(os.path.abspath(path)), source)
+            if os.path.abspath(owner) != os.path.abspath(source):
+                stats['failed'] += 1
+                print(f'{source}: output {path} clashes with {owner}', file=sys.stderr)
+                continue
+            key  = cache.key(source, compiler)
+            code = cache.get(key)
+            if code is None:
+                pending.append((source, path, key))
+            elif up_to_date(path, code):
+                stats['up to date'] += 1
+            else:
+                write_output(path, code)
+                stats['restored'] += 1
+
+    if pending:
+        workers = min(jobs or os.cpu_count(), len(pending))
+        with ProcessPoolExecutor(workers) as pool:
+            results = pool.map(compile_job, [source for source, _, _ in pending],
+                               [options] * len(pending), chunksize=max(1, len(pending) // (8 * workers)))
+            for (source, path, key), (code, error) in zip(pending, results):
+                if error is not None:
+                    stats['failed'] += 1
+                    print(f'{source}: {error}', file=sys.stderr)
+                    continue
+                cache.put(key, code)
+                write_output(path, code)
+                stats['compiled'] += 1
+
+    stats['evicted'] = cache.evict()
+    return stats
+
+
+def main(argv):
+    args  = parse_args(argv[1:])
+    stats = build(args.sources, args.output_dir, args.jobs, args.cache_dir,
+                  int(args.cache_size * 2 ** 20), **backend_options(args))
+    print(', '.join(f'{name}: {count}' for name, count in stats.items()), file=sys.stderr)
+    sys.exit(1 if stats['failed'] else 0)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,268 @@
+from tokens import Integer, Variable, Assign, MultiplicativeOperation
+from operation_utils import Definition, Usage
+from loop_invariants import LoopInvariants, is_operation
+from dataflow import solve, iter_bits
+
+
+class CommonSubexpressions:
+    """
+        Value numbering of the arithmetic trees: a tree is numbered by its
+        operation and the numbers of its operands (variables by name,
+        literals by value, the operands of ADD and IMUL in either order) and
+        a number dies when a variable it reads is assigned. An available
+        expressions dataflow pass over the blocks carries the numbers alive
+        at the end of the predecessors into a block, so a tree computed
+        again before any of its variables changed is replaced by a read of a
+        new variable the earlier computations save their result into.
+    """
+
+    def __init__(self, flow_graph: list, eax):
+        self.flow_graph = flow_graph
+        self.eax        = eax
+        self.index      = {block: i for i, block in enumerate(flow_graph)}
+        self.statement  = {}                # operation -> root of its statement
+        self.parents    = {}                # operation -> (parent, attribute)
+        self.keys       = {}                # operation -> its number (a nested tuple)
+        self.names      = {}                # number -> variables it reads
+        self.users      = {}                # variable -> numbers reading it
+        self.replaced   = 0                 # trees replaced by a read
+        self.saved      = 0                 # computations saved for the reads
+
+    def number(self, operand):
+        if type(operand) == Integer:
+            return operand._value
+        if type(operand) == Variable:
+            return operand.name
+        return self.keys.get(operand)
+
+    @staticmethod
+    def variables(key):
+        names, stack = set(), [key]
+        while stack:
+            key = stack.pop()
+            if type(key) == str:
+                names.add(key)
+            elif type(key) == tuple:
+                stack.extend(key[1:])
+        return names
+
+    @staticmethod
+    def worth(op):
+        """
+            a read of the variable is cheaper than computing the tree again
+            unless it is a single ADD / SUB or a product lowered to one instruction
+        """
+        if len(LoopInvariants.subtree(op)) > 1:
+            return True
+        return isinstance(op, MultiplicativeOperation) and (op.lowering is None or len(op.lowering) > 1)
+
+    def split(self):
+        """
+            statements and numbers, the trees of a statement assigning inside
+            get none: taking one out of it could move it over the assignment
+        """
+        for block in self.flow_graph:
+            operations = set(block.operations)
+            for op in reversed(block.operations):           # parents follow their operands
+                root = self.statement.setdefault(op, op)
+                for attribute in ('left', 'right', 'expr'):
+                    child = getattr(op, attribute, None)
+                    if child in operations:
+                        self.statement[child] = root
+                        self.parents[child] = (op, attribute)
+
+            assigning = {self.statement[op] for op in block.operations
+                         if type(op) == Assign and self.statement[op] is not op}
+            for op in block.operations:
+                if not is_operation(op) or self.statement[op] in assigning \
+                        or type(op.left) == type(op.right) == Integer:
+                    continue
+                left, right = self.number(op.left), self.number(op.right)
+                if left is None or right is None:
+                    continue
+                if op.operation in ('ADD', 'IMUL'):
+                    left, right = sorted((left, right), key=repr)
+                key = (op.operation, left, right)
+                self.keys[op] = key
+                if key not in self.names:
+                    self.names[key] = CommonSubexpressions.variables(key)
+                    for name in self.names[key]:
+                        self.users.setdefault(name, set()).add(key)
+
+    def walk(self, block, available: set, visit=None):
+        """
+            runs the numbers alive through the block, `visit(op, available)`
+            sees every numbered operation before it is computed
+        """
+        for op in block.operations:
+            key = self.keys.get(op)
+            if key is not None:
+                if visit:
+                    visit(op, available)
+                available.add(key)
+            for du in op.du:
+                if type(du) == Definition:
+                    available.difference_update(self.users.get(du.expression.name, ()))
+        return available
+
+    def available(self):
+        """numbers alive at the start of every block"""
+        bits    = {key: 1 << i for i, key in enumerate(self.names)}
+        users   = {name: sum(bits[key] for key in keys) for name, keys in self.users.items()}
+
+        successors, gen, kill = [], [], []
+        for block in self.flow_graph:
+            successors.append([self.index[successor] for successor in block.successors()])
+            killed = 0
+            for op in block.operations:
+                for du in op.du:
+                    if type(du) == Definition:
+                        killed |= users.get(du.expression.name, 0)
+            gen.append(sum(bits[key] for key in self.walk(block, set())))
+            kill.append(killed)
+        inputs, _ = solve(successors, gen, kill, intersect=True, universe=(1 << len(bits)) - 1)
+
+        keys = list(self.names)
+        return [{keys[i] for i in iter_bits(mask)} for mask in inputs]
+
+    def redundant(self, available):
+        """the largest trees computed again whose value is available, worth reading back"""
+        redundant = set()
+
+        def visit(op, alive):
+            if self.keys[op] in alive:
+                redundant.add(op)
+
+        for block, alive in zip(self.flow_graph, available):
+            self.walk(block, set(alive), visit)
+        return [op for op in redundant if CommonSubexpressions.worth(op)
+                and self.parents.get(op, (None,))[0] not in redundant]
+
+    def reaching(self, reads, saves):
+        """
+            {read: bits of the saves reaching it}, a save is a computation of
+            a number read somewhere, the last one on the way to a read reaches it
+        """
+        bit     = {op: 1 << i for i, op in enumerate(saves)}
+        bits    = {}                        # number -> bits of its saves
+        for op in saves:
+            bits[self.keys[op]] = bits.get(self.keys[op], 0) | bit[op]
+
+        def run(block, current, found=None):
+            for op in block.operations:
+                if op in reads and found is not None:
+                    found[op] = current.get(self.keys[op], 0)
+                elif op in bit:
+                    current[self.keys[op]] = bit[op]
+            return current
+
+        successors, gen, kill = [], [], []
+        for block in self.flow_graph:
+            successors.append([self.index[successor] for successor in block.successors()])
+            current = run(block, {})
+            gen.append(sum(current.values()))
+            kill.append(sum(bits[key] for key in current))
+        inputs, _ = solve(successors, gen, kill)
+
+        found = {}
+        for block, mask in zip(self.flow_graph, inputs):
+            run(block, {key: mask & keys for key, keys in bits.items() if mask & keys}, found)
+        return found
+
+    def variables_of(self, reads, saves):
+        """
+            a variable for every web of saves and reads: the saves reaching a
+            read share it, the registers are set on the variable of a definition
+        """
+        group = list(range(len(saves)))
+
+        def find(i):
+            while group[i] != i:
+                group[i] = group[group[i]]
+                i = group[i]
+            return i
+
+        reaching = self.reaching(reads, saves)
+        for mask in reaching.values():
+            first = None
+            for i in iter_bits(mask):
+                if first is None:
+                    first = find(i)
+                else:
+                    group[find(i)] = first
+
+        variables, of = {}, {}
+        for read, mask in reaching.items():
+            if not mask:                    # can't happen when numbers are available
+                continue
+            root = find(next(iter_bits(mask)))
+            if root not in variables:
+                variables[root] = Variable(f'__common_{len(variables)}')
+            of[read] = variables[root]
+        for i, op in enumerate(saves):
+            if find(i) in variables:
+                of[op] = variables[find(i)]
+        return of
+
+    def read(self, op, variable):
+        """the parent of `op` reads `variable` instead"""
+        parent, attribute = self.parents[op]
+        setattr(parent, attribute, variable)
+        parent.du.append(Usage(variable, parent))
+        if attribute == 'right':
+            parent.left.in_stack = False    # nothing is computed after the left operand now
+
+    def rewrite(self, reads, of):
+        """
+            the reads lose their trees, a save is moved with its tree in front
+            of its statement as `variable = tree` (a statement of its own keeps
+            its place) and the statement reads the variable
+        """
+        for block in self.flow_graph:
+            for op in [op for op in block.operations if op in reads and op in of]:
+                tree = LoopInvariants.subtree(op)
+                block.operations[:] = [other for other in block.operations if other not in tree]
+                if op in self.parents:          # else a statement of its own, nothing reads it
+                    self.read(op, of[op])
+                self.replaced += 1
+
+            for op in [op for op in block.operations if op in of and op not in reads]:
+                root    = self.statement[op]
+                save    = Assign(of[op], op, self.eax)
+                subtree = LoopInvariants.subtree(op)
+                tree    = [other for other in block.operations if other in subtree]
+                for other in tree:
+                    self.statement[other] = save
+                self.statement[save] = save
+                if op is root:
+                    block.operations.insert(block.operations.index(op) + 1, save)
+                else:
+                    block.operations[:] = [other for other in block.operations if other not in tree]
+                    position = next(i for i, other in enumerate(block.operations) if self.statement[other] is root)
+                    block.operations[position:position] = tree + [save]
+                    op.in_stack, op.temp = False, None
+                    self.read(op, of[op])
+                self.saved += 1
+
+    def run(self):
+        """(trees replaced by a read, computations saved)"""
+        self.split()
+        if not self.keys:
+            return 0, 0
+        reads   = self.redundant(self.available())
+        if not reads:
+            return 0, 0
+        numbers = {self.keys[op] for op in reads}
+        removed = {op for read in reads for op in LoopInvariants.subtree(read)}
+        saves   = [op for block in self.flow_graph for op in block.operations
+                   if self.keys.get(op) in numbers and op not in removed]
+        reads   = set(reads)
+        self.rewrite(reads, self.variables_of(reads, saves))
+        return self.replaced, self.saved
+
+
+def eliminate_common_subexpressions(flow_graph: list, eax):
+    """runs the pass in place, returns (trees replaced by a read, computations saved)"""
+    if not flow_graph:
+        return 0, 0
+    return CommonSubexpressions(flow_graph, eax).run()
@@ -0,0 +1,343 @@
+import sys
+from nametable import SymbolTable, DuplicateNamesException
+from tokens import EAX, RET, Integer, Variable, START_WHILE, MID_WHILE, END_WHILE
+from operation_utils import BasicBlock, DUGraph, DUChain, Web, InterferenceGraph, Definition, Usage
+from expression_order import reorder_expressions
+from instructions import Instruction, Label, inverted
+from peephole import optimize
+from constant_propagation import propagate_constants
+from loop_invariants import hoist_invariants
+from strength_reduction import reduce_strength
+from dead_code import eliminate_dead_code
+from common_subexpressions import eliminate_common_subexpressions
+from linear_scan import LinearScan
+from target import Target
+from profiler import Profiler
+from emitter import Emitter
+from function_cache import FunctionCache
+
+
+class CompilationContext:
+    """
+        Everything one compilation owns: the symbol table, the flow graphs the
+        parser fills (one per function) and the sink the code is written to.
+        A new context is created for every compiled file, so compilations
+        don't share state but the `cache` of function code passed in.
+    """
+
+    def __init__(self, output=None, allocator='greedy', coalesce=True, reorder=True, peephole=True,
+                 constants=True, licm=True, strength=True, cse=True, dce=True, rotate=False, registers=None,
+                 profiler=None, debug=None, cache=None):
+        self.output     = Emitter(output if output is not None else sys.stdout)
+        self.debug      = debug                     # text stream for the dump of blocks, chains and colours, None for none
+        self.profiler   = profiler or Profiler(enabled=False)
+        self.allocator  = allocator                 # 'greedy', 'briggs' (InterferenceGraph.colour) or 'linear'
+        self.coalesce   = coalesce                  # join webs of non-interfering copies
+        self.reorder    = reorder                   # Sethi-Ullman evaluation order of expressions
+        self.peephole   = peephole                  # rewrite the instruction list with peephole.RULES
+        self.constants  = constants                 # conditional constant propagation before allocation
+        self.licm       = licm                      # hoist loop invariant trees into preheaders
+        self.strength   = strength                  # induction variables for products, IMUL / IDIV by literals lowered
+        self.cse        = cse                       # read trees computed again from a variable saving the first result
+        self.dce        = dce                       # drop statements whose results are never used, and empty blocks
+        self.rotate     = rotate                    # lay loops out as guarded do-while
+        self.target     = Target(registers)         # registers to allocate, None for all of Target.allocatable
+        self.fired      = {}                        # peephole rule -> times it fired
+        self.cache      = cache                     # FunctionCache shared by the compilations of a process, or None
+
+        self.name_table = SymbolTable()
+        self.loops      = 0                         # current amount of loops
+        self.flow_graph = [BasicBlock()]            # graph of basic-blocks (linear in this case)
+        self.operations = self.flow_graph[0].operations     # list of operations
+        self.eax        = EAX()
+
+        self.units      = []                        # [name, flow graph, token texts] of every function
+        self.function   = None                      # name of the function being parsed
+        self.declared   = []                        # token texts of the global declarations
+        self.declarations = {}                      # global name -> token texts of its declaration
+
+    @property
+    def loop_id(self):
+        """loops of the functions after the first one are labelled by function"""
+        return self.loops if len(self.units) < 2 else f'{self.function}_{self.loops}'
+
+    def declaration(self, texts):
+        """the parser read a global declaration"""
+        self.declared.append(texts)
+        for name in self.name_table.outermost_scope.entities:
+            self.declarations.setdefault(name, texts)
+
+    def begin_function(self, name):
+        """
+            the parser starts a function, the first one continues the flow
+            graph of the global initializers, the others get their own
+        """
+        if any(unit[0] == name for unit in self.units):
+            raise DuplicateNamesException(name)
+        if self.units:
+            self.flow_graph = [BasicBlock()]
+            self.operations = self.flow_graph[0].operations
+            self.loops      = 0
+        self.function = name
+        self.units.append([name, self.flow_graph, None])
+
+    def end_function(self, texts):
+        self.units[-1][2] = texts
+
+    @staticmethod
+    def referenced(flow_graph):
+        return {du.expression.name for block in flow_graph for op in block.operations for du in op.du}
+
+    def key(self, entry, texts, pinned):
+        """
+            cache key of a function: its tokens, the declarations of the
+            globals it names, which of them stay in memory and the options
+        """
+        texts   = [texts] if not entry else self.declared + [texts]
+        names   = sorted(set(texts[-1]) & self.declarations.keys())
+        options = [self.allocator, self.coalesce, self.reorder, self.peephole, self.constants, self.licm,
+                   self.strength, self.cse, self.dce, self.rotate, self.target.registers]
+        return FunctionCache.key(entry, texts, [self.declarations[name] for name in names], pinned, options)
+
+    def generate(self):
+        """
+            register allocation and code of every function, the code is
+            emitted when all of them are done. The globals the functions
+            after the first one use stay in memory (`__global_<name>`),
+            the rest of the variables are allocated one function at a time.
+            Functions found in the cache aren't allocated again
+        """
+        profiler    = self.profiler
+        units       = self.units or [[None, self.flow_graph, []]]
+        variables   = {name for name, entity in self.name_table.outermost_scope.entities.items() if entity.mutable}
+        referenced  = [CompilationContext.referenced(flow_graph) & variables for _, flow_graph, _ in units]
+        shared      = sorted(set().union(*referenced[1:]))
+
+        pieces = []
+        for i, (name, flow_graph, texts) in enumerate(units):
+            pinned  = sorted(referenced[i].intersection(shared))
+            key     = None
+            if self.cache is not None and self.debug is None:
+                key     = self.key(i == 0, texts, pinned)
+                piece   = self.cache.get(key)
+                if piece is not None:
+                    profiler.count('cached_functions', 1)
+                    profiler.count('bss_slots', len(piece['slots']))
+                    profiler.count('instructions', piece['instructions'])
+                    pieces.append(piece)
+                    continue
+            self.flow_graph = flow_graph
+            piece = self.generate_unit(None if i == 0 else name, pinned)
+            if key is not None:
+                self.cache.put(key, piece)
+            pieces.append(piece)
+
+        with profiler.phase('emission'):
+            self.emit_code([unit[0] for unit in units], pieces, shared)
+
+    def expose(self, pinned):
+        """
+            the globals in memory the function assigns are read by its
+            returns, so the passes keep the assignments. One is added at
+            the end if the code falls off it
+        """
+        assigned = sorted(set(pinned).intersection(du.expression.name for block in self.flow_graph
+                                                   for op in block.operations for du in op.du
+                                                   if type(du) == Definition))
+        if not assigned:
+            return
+        last_block = self.flow_graph[-1].operations
+        if not last_block or type(last_block[-1]) != RET:
+            self.flow_graph[-1].add(RET(Integer(0), self.eax))
+        for block in self.flow_graph:
+            for op in block.operations:
+                if type(op) == RET:
+                    op.du.extend(Usage(Variable(name), op) for name in assigned)
+
+    def pin(self, pinned):
+        """the globals in memory get their slots and leave the du-chains"""
+        pinned = set(pinned)
+        for block in self.flow_graph:
+            for op in block.operations:
+                if not any(du.expression.name in pinned for du in op.du):
+                    continue
+                for du in op.du:
+                    if du.expression.name in pinned:
+                        du.expression.register.name = f'__global_{du.expression.name}'
+                        du.expression.register.real = False
+                op.du = [du for du in op.du if du.expression.name not in pinned]
+
+    def generate_unit(self, label=None, pinned=()):
+        """
+            the passes, allocation and instructions of the current flow
+            graph, a function but the first one has its slots suffixed with
+            its `label`. Returns the piece of code the cache keeps:
+            {'lines': [...], 'slots': [...], 'instructions': count}
+        """
+        profiler = self.profiler
+        self.expose(pinned)
+
+        with profiler.phase('constants'):
+            replaced, folded, removed = propagate_constants(self.flow_graph) if self.constants else (0, 0, 0)
+        with profiler.phase('licm'):
+            hoisted = hoist_invariants(self.flow_graph, self.eax) if self.licm else 0
+        with profiler.phase('strength'):
+            reduced, lowered = reduce_strength(self.flow_graph, self.eax) if self.strength else (0, 0)
+        with profiler.phase('dce'):
+            dead, empty = eliminate_dead_code(self.flow_graph) if self.dce else (0, 0)
+        with profiler.phase('cse'):
+            common, saved = eliminate_common_subexpressions(self.flow_graph, self.eax) if self.cse else (0, 0)
+        self.pin(pinned)
+        with profiler.phase('du-graph'):
+            du_graph = DUGraph.from_flowgraph(self.flow_graph)
+        with profiler.phase('chains'):
+            du_chains = DUChain.build_chains(du_graph)
+        with profiler.phase('webs'):
+            webs    = Web.from_chains(du_chains)
+            constraints = self.target.constraints(self.flow_graph, du_graph)
+
+        interference_graph, coalesced = None, 0
+        if self.allocator == 'linear':
+            with profiler.phase('linear-scan'):
+                allocator = LinearScan(du_graph, webs, self.flow_graph, self.target, constraints)
+                colour_lists, priorities, registers = allocator.colour()
+                registers = self.slots_of(registers, label)
+                allocator.allocate(colour_lists, priorities, registers)
+        else:
+            with profiler.phase('interference'):
+                interference_graph = InterferenceGraph(du_graph, webs, target=self.target)
+                depths  = BasicBlock.loop_depths(self.flow_graph)
+                if self.coalesce:
+                    coalesced = interference_graph.coalesce(interference_graph.copies(du_graph, depths))
+                    webs    = list(interference_graph.inverse_mapping.values())
+            with profiler.phase('colouring'):
+                colour_lists, priorities, registers = interference_graph.colour(self.allocator, depths, constraints)
+                registers = self.slots_of(registers, label)
+                interference_graph.allocate(colour_lists, priorities, registers)
+        with profiler.phase('reorder'):
+            temporaries = reorder_expressions(self.flow_graph, du_graph, self.target.registers) if self.reorder else None
+
+        if profiler.enabled:
+            profiler.count('constant_uses', replaced)
+            profiler.count('folded_operations', folded)
+            profiler.count('dead_assigns', removed)
+            profiler.count('hoisted', hoisted)
+            profiler.count('induction_products', reduced)
+            profiler.count('lowered_operations', lowered)
+            profiler.count('dead_operations', dead)
+            profiler.count('empty_blocks', empty)
+            profiler.count('common_subexpressions', common)
+            profiler.count('saved_subexpressions', saved)
+            profiler.count('du_nodes', len(du_graph))
+            profiler.count('chains', len(du_chains))
+            profiler.count('webs', len(webs))
+            profiler.count('edges', interference_graph.edges() if interference_graph else 0)
+            profiler.count('coalesced_moves', coalesced)
+            profiler.count('colours', len(colour_lists))
+            profiler.count('spills', sum(len(colour_lists[colour]) for colour, register in zip(priorities, registers)
+                                         if register not in self.target.registers))
+
+        with profiler.phase('emission'):
+            piece = self.render(registers)
+            for rule, count in self.fired.items():
+                profiler.count(f'peephole.{rule}', count)
+            if self.debug is not None:
+                self.emit_debug(Emitter(self.debug), du_chains, webs, colour_lists, priorities, registers,
+                                coalesced, temporaries)
+        return piece
+
+    def slots_of(self, registers, label):
+        """the registers of the colours, slot names made unique to the function"""
+        if label is None:
+            return registers
+        return [register if register in self.target.registers else f'{register}_{label}' for register in registers]
+
+    def render(self, registers):
+        """the piece of code of the current flow graph, see generate_unit"""
+        slots = [var for var in registers if var not in self.target.registers]
+        code  = self.instructions()
+        last_block = self.flow_graph[-1].operations
+        if not last_block or type(last_block[-1]) != RET:
+            code += [Instruction('MOV', 'eax', 0), Instruction('RET')]
+        if self.peephole:
+            code, self.fired = optimize(code)
+
+        lines, count = [], 0
+        for instruction in code:
+            if type(instruction) == Label:
+                lines.append('')
+            else:
+                count += 1
+            lines.append(str(instruction))
+        self.profiler.count('bss_slots', len(slots))
+        self.profiler.count('instructions', count)
+        return {'lines': lines, 'slots': slots, 'instructions': count}
+
+    def emit_code(self, names, pieces, shared):
+        """
+            the first function is CMAIN, the others follow under `_<name>`
+            labels, their slots and the globals in memory share the .bss
+        """
+        output = self.output
+        output.line('%include "io.inc"\n\nsection .bss')
+        output.lines(f'{var}: resd 1' for piece in pieces for var in piece['slots'])
+        output.lines(f'__global_{name}: resd 1' for name in shared)
+        output.line('__temp: resd 1')
+        output.line('\nsection .text\nglobal CMAIN\nCMAIN:\n\tMOV ebp,\tesp; for correct debugging')
+        output.lines(pieces[0]['lines'])
+        for name, piece in zip(names[1:], pieces[1:]):
+            output.line(f'\n_{name}:')
+            output.lines(piece['lines'])
+        output.flush()
+        self.profiler.count('bss_slots', len(shared))
+
+    def instructions(self):
+        """
+            instructions of the whole flow graph. With `rotate` a loop becomes
+            a guarded do-while: its condition is checked once before the body
+            and again at the bottom, where a conditional jump goes back, so an
+            iteration takes one branch instead of two
+        """
+        if not self.rotate:
+            return [instruction for block in self.flow_graph
+                    for op in block.operations for instruction in op.instructions]
+
+        code        = []
+        conditions  = {}                            # loop_id -> (condition instructions, exit jump)
+        for block in self.flow_graph:
+            operations = block.operations
+            if operations and type(operations[0]) == START_WHILE and type(operations[-1]) == MID_WHILE:
+                loop_id     = operations[0].loop_id
+                condition   = [instruction for op in operations[1:-1] for instruction in op.instructions]
+                conditions[loop_id] = condition, operations[-1].instructions[0].opcode
+                code += condition + operations[-1].instructions + [Label(f'while_{loop_id}')]
+                continue
+            for op in operations:
+                if type(op) == END_WHILE and op.loop_id in conditions:
+                    condition, jump = conditions[op.loop_id]
+                    code += condition + [Instruction(inverted[jump], f'while_{op.loop_id}'),
+                                         Label(f'end_while_{op.loop_id}')]
+                else:
+                    code += op.instructions
+        return code
+
+    def emit_debug(self, output, du_chains, webs, colour_lists, priorities, registers,
+                   coalesced, temporaries):
+        """the dump is formatted only here, when a debug stream is given"""
+        for block in self.flow_graph:
+            output.line(f'\n; {block},\tl: {block.left},\tr: {block.right}')
+            output.line('; <' + '-' * 20 + '>')
+            for operation in block.operations:
+                output.line(f';  {type(operation)} \t {operation} \t {operation.du}')
+
+        output.line('\n; du-chains:')
+        output.lines(f';  {chain}' for chain in du_chains)
+        output.line(f'\n; Webs:  {webs}')
+        output.line(f'\n; Mapping:  {dict(enumerate(webs))}')
+        output.line(f'\n; Colours:  {colour_lists}')
+        output.line(f'\n; priorities: {priorities}')
+        output.line(f'\n; registers: {registers}')
+        output.line(f'\n; coalesced moves: {coalesced}')
+        output.line(f'\n; peephole rules fired: {self.fired}')
+        output.line(f'\n; temporaries in registers, in stack: {temporaries}')
+        output.flush()
@@ -1,15 +1,258 @@
+import os
 import sys
-from antlr4 import FileStream, CommonTokenStream
-from CLexer import CLexer
-from CParser import CParser
-from graph_colouring import colour_graph 
+import json
+import socket
+import argparse
+import io
+from compilation import CompilationContext
+from profiler import Profiler
+from function_cache import FunctionCache
+from target import Target
 
-def main(argv):
-    input_stream = FileStream(argv[1])
+def parse_args(argv):
+    arg_parser = argparse.ArgumentParser(description='C subset -> NASM compiler',
+                                         epilog='compiled functions are cached in memory for the life of the '
+                                                'process, so the cache saves work only in the batch, --server '
+                                                'and --socket modes')
+    arg_parser.add_argument('sources', nargs='*',
+                            help='.c files or directories with .c files to compile')
+    arg_parser.add_argument('-o', '--output-dir',
+                            help='directory for .asm files (default: stdout for a single file, '
+                                 'next to the sources otherwise)')
+    arg_parser.add_argument('--manifest',
+                            help='file with one source path per line')
+    arg_parser.add_argument('--server', action='store_true',
+                            help='serve compilation requests from stdin, one per line')
+    arg_parser.add_argument('--socket',
+                            help='serve compilation requests on a Unix socket at this path')
+    arg_parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                            help='write phase times, peak memory and counters as a JSON line '
+                                 'per compiled file to FILE (default: stderr)')
+    arg_parser.add_argument('--dump', nargs='?', const='-', metavar='FILE',
+                            help='append the blocks, du-chains, webs and colours of every compiled '
+                                 'file to FILE (default: stderr)')
+    add_backend_arguments(arg_parser)
+    return arg_parser.parse_args(argv)
+
+def registers(text):
+    """--registers value, checked by Target"""
+    try:
+        return Target.parse(text).registers
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+def add_backend_arguments(arg_parser):
+    arg_parser.add_argument('--frontend', choices=['antlr', 'pratt'], default='antlr',
+                            help='parser: the one ANTLR generates from C.g4 (default) or the hand-written '
+                                 'pratt.py, which doesn\'t need the ANTLR runtime')
+    arg_parser.add_argument('--no-constants', dest='constants', action='store_false',
+                            help="don't propagate and fold constants over the flow graph")
+    arg_parser.add_argument('--no-licm', dest='licm', action='store_false',
+                            help="don't move loop invariant computations out of the loops")
+    arg_parser.add_argument('--no-strength-reduction', dest='strength', action='store_false',
+                            help="keep IMUL / IDIV by literals and products of induction variables")
+    arg_parser.add_argument('--no-dce', dest='dce', action='store_false',
+                            help="keep assignments whose values are never used and the empty blocks")
+    arg_parser.add_argument('--no-cse', dest='cse', action='store_false',
+                            help="compute repeated expressions again instead of reusing the earlier result")
+    arg_parser.add_argument('--rotate-loops', dest='rotate', action='store_true',
+                            help='lay loops out as a guarded do-while with the condition at the bottom')
+    arg_parser.add_argument('--allocator', choices=['greedy', 'briggs', 'linear'], default='greedy',
+                            help='register allocator (default: greedy), linear scan skips the '
+                                 'interference graph for very large functions')
+    arg_parser.add_argument('--registers', type=registers, default=None,
+                            help='comma separated registers to allocate (default: ebx,ecx,edx,esi,edi), '
+                                 'eax is always the accumulator')
+    arg_parser.add_argument('--no-coalesce', dest='coalesce', action='store_false',
+                            help="don't join the webs of copies before colouring")
+    arg_parser.add_argument('--no-reorder', dest='reorder', action='store_false',
+                            help="don't reorder expressions by Sethi-Ullman numbers")
+    arg_parser.add_argument('--no-peephole', dest='peephole', action='store_false',
+                            help="don't run the peephole optimizer over the emitted instructions")
+
+def backend_options(args):
+    """CompilationContext options from the parsed arguments"""
+    return {'frontend': args.frontend, 'allocator': args.allocator, 'coalesce': args.coalesce, 'reorder': args.reorder,
+            'peephole': args.peephole, 'constants': args.constants,
+            'licm': args.licm, 'strength': args.strength, 'dce': args.dce, 'cse': args.cse, 'rotate': args.rotate,
+            'registers': args.registers}
+
+def parse_antlr(source, context):
+    """runs the parser ANTLR generated, the runtime is imported only when it is used"""
+    from antlr4 import FileStream, CommonTokenStream
+    from CLexer import CLexer
+    from CParser import CParser
+
+    input_stream = FileStream(source)
     lexer = CLexer(input_stream)
     stream = CommonTokenStream(lexer)
     parser = CParser(stream)
-    tree = parser.source_code()
- 
+    parser.context = context
+    parser.source_code()
+
+def parse_pratt(source, context):
+    import pratt
+
+    with open(source) as text:
+        pratt.parse(text.read(), context)
+
+FRONTENDS = {'antlr': parse_antlr, 'pratt': parse_pratt}
+
+def compile_source(source, output, profile=None, profiler=None, frontend='antlr', dump=None, **options):
+    """
+        compiles a .c file, the .asm goes to the `output` text stream,
+        options are passed to CompilationContext. With `profile` (a path
+        or '-' for stderr) the phase report is written there, a `profiler`
+        passed in keeps its records for the caller. `frontend` is a key
+        of FRONTENDS. With `dump` (a path or '-') the allocation dump is
+        appended there.
+    """
+    profiler = profiler or Profiler(enabled=profile is not None)
+    debug = None
+    if dump is not None:
+        debug = sys.stderr if dump == '-' else open(dump, 'a')
+        debug.write(f'; {source}\n')
+    context = CompilationContext(output, profiler=profiler, debug=debug, **options)
+    try:
+        with profiler.phase('parse'):
+            FRONTENDS[frontend](source, context)
+        context.generate()
+    finally:
+        profiler.stop()
+        if debug is not None and debug is not sys.stderr:
+            debug.close()
+    if profile is not None:
+        profiler.dump(profile, source=source)
+
+def collect_roots(paths, manifest=None):
+    """
+        [(source, root)] of the .c files under the directories, the files
+        and the paths listed in the manifest. `root` is what the output path
+        is relative to (see output_path): the directory given, the directory
+        of the manifest, or None for a file given alone
+    """
+    entries = [(path, path if os.path.isdir(path) else None) for path in paths]
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as lines:
+            entries += [(os.path.join(base, line.strip()), base) for line in lines
+                        if line.strip() and not line.startswith('#')]
+    sources = []
+    for path, root in entries:
+        if os.path.isdir(path):
+            for directory, _, files in sorted(os.walk(path)):
+                sources += [(os.path.join(directory, name), root) for name in sorted(files) if name.endswith('.c')]
+        else:
+            sources.append((path, root))
+    return sources
+
+def collect_sources(paths, manifest=None):
+    return [source for source, _ in collect_roots(paths, manifest)]
+
+def output_path(source, output_dir=None, root=None):
+    """
+        next to the source without `output_dir`, else under it at the path
+        of the source relative to `root`, or at its name without a root
+    """
+    if not output_dir:
+        return os.path.splitext(source)[0] + '.asm'
+    relative = os.path.relpath(source, root) if root else os.path.basename(source)
+    if relative.startswith(os.pardir + os.sep):             # outside the root, e.g. ../x.c in a manifest
+        relative = os.path.basename(source)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + '.asm')
+
+def compile_batch(sources, output_dir=None, **options):
+    """
+        compiles every (source, root) of collect_roots in this process,
+        returns the number of failures. A source whose output path another
+        one already has fails instead of overwriting it
+    """
+    failures = 0
+    owners   = {}                                   # output path -> source writing it
+    for source, root in sources:
+        path  = output_path(source, output_dir, root)
+        owner = owners.setdefault(os.path.normcase(os.path.abspath(path)), source)
+        if os.path.abspath(owner) != os.path.abspath(source):
+            failures += 1
+            print(f'{source}: output {path} clashes with {owner}', file=sys.stderr)
+            continue
+        output = io.StringIO()
+        try:
+            compile_source(source, output, **options)
+        except Exception as error:
+            failures += 1
+            print(f'{source}: {getattr(error, "message", error)}', file=sys.stderr)
+            continue
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as asm:
+            asm.write(output.getvalue())
+    return failures
+
+def handle_request(line, **options):
+    """
+        A request is a source path or a JSON object {"source": path, "output": path},
+        without "output" the code is sent back in the response. `options` go
+        to compile_source, so `profile` and `dump` work as for a batch
+    """
+    request = json.loads(line) if line.startswith('{') else {'source': line}
+    output = io.StringIO()
+    try:
+        compile_source(request['source'], output, **options)
+    except Exception as error:
+        return {'source': request.get('source'), 'ok': False, 'error': str(getattr(error, 'message', error))}
+    if request.get('output'):
+        with open(request['output'], 'w') as asm:
+            asm.write(output.getvalue())
+        return {'source': request['source'], 'ok': True, 'output': request['output']}
+    return {'source': request['source'], 'ok': True, 'asm': output.getvalue()}
+
+def serve(requests, responses, **options):
+    for line in requests:
+        line = line.strip()
+        if not line:
+            continue
+        responses.write(json.dumps(handle_request(line, **options)) + '\n')
+        responses.flush()
+
+def serve_socket(path, **options):
+    if not hasattr(socket, 'AF_UNIX'):
+        raise SystemExit('Unix sockets are not supported on this platform, use --server')
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile('r') as requests, connection.makefile('w') as responses:
+                serve(requests, responses, **options)
+    finally:
+        server.close()
+        os.remove(path)
+
+def main(argv):
+    args = parse_args(argv[1:])
+    options = backend_options(args)
+    cache   = FunctionCache()               # functions compiled before in this process are taken from here
+
+    if args.socket:
+        serve_socket(args.socket, profile=args.profile, dump=args.dump, cache=cache, **options)
+        return
+    if args.server:
+        serve(sys.stdin, sys.stdout, profile=args.profile, dump=args.dump, cache=cache, **options)
+        return
+
+    if len(args.sources) == 1 and os.path.isfile(args.sources[0]) \
+            and not (args.manifest or args.output_dir):
+        compile_source(args.sources[0], sys.stdout, args.profile, dump=args.dump, cache=cache, **options)
+        return
+
+    sources = collect_roots(args.sources, args.manifest)
+    if not sources:
+        raise SystemExit('Nothing to compile')
+    sys.exit(1 if compile_batch(sources, args.output_dir, profile=args.profile, dump=args.dump, cache=cache,
+                                **options) else 0)
+
 if __name__ == '__main__':
     main(sys.argv)
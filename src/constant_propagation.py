@@ -0,0 +1,245 @@
+from tokens import Integer, Variable, Assign, AdditiveOperation, MultiplicativeOperation, \
+    Condition, RET, START_WHILE, MID_WHILE, END_WHILE
+from dataflow import solve
+
+# lattice: TOP (no value reached yet) > an int constant > BOTTOM (not a constant)
+TOP     = 'top'
+BOTTOM  = 'bottom'
+
+
+def meet(first, second):
+    if first == TOP:
+        return second
+    if second == TOP or first == second:
+        return first
+    return BOTTOM
+
+
+def wrap(value):
+    """two's complement 32-bit value, as the generated code computes it"""
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def fold(operation, left, right):
+    """the constant an operation computes, BOTTOM when it traps or isn't known"""
+    if BOTTOM in (left, right):
+        return BOTTOM
+    if TOP in (left, right):
+        return TOP
+    if operation == 'ADD':
+        return wrap(left + right)
+    if operation == 'SUB':
+        return wrap(left - right)
+    if operation == 'IMUL':
+        return wrap(left * right)
+    if right == 0 or wrap(left // right) != left // right:  # IDIV faults
+        return BOTTOM
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def taken(jmp, left, right):
+    """does MID_WHILE's (inverted) jump leave the loop for these operands"""
+    return {'jge': left >= right, 'jg': left > right, 'jle': left <= right,
+            'jl': left < right, 'jne': left != right, 'je': left == right}[jmp]
+
+
+def operands(op):
+    """(attribute, operand) pairs an operation reads"""
+    if type(op) == Assign:
+        return [('right', op.right)]
+    if type(op) == RET:
+        return [('expr', op.expr)]
+    if isinstance(op, (AdditiveOperation, MultiplicativeOperation, Condition)):
+        return [('left', op.left), ('right', op.right)]
+    return []
+
+
+class ConstantPropagation:
+    """
+        Conditional constant propagation over the flow graph: a dataflow
+        pass over the blocks (the code isn't in SSA form) that only follows
+        the edges found executable, so a loop whose condition is constantly
+        false doesn't spoil the values after it. Values reaching a loop
+        header over the back edge are met with the ones from before the loop.
+    """
+
+    def __init__(self, flow_graph: list):
+        self.flow_graph = flow_graph
+        self.names      = sorted({du.expression.name for block in flow_graph
+                                  for op in block.operations for du in op.du})
+        self.states     = {}                # block -> {name: value} at its start
+        self.values     = {}                # operation -> value it computes
+        self.executable = set()             # blocks reached so far
+        self.removed    = set()             # variables of the definitions removed
+
+    def value(self, operand, state):
+        if type(operand) == Integer:
+            return operand._value
+        if type(operand) == Variable:
+            return state.get(operand.name, TOP)
+        if operand in self.values:
+            return self.values[operand]
+        return BOTTOM
+
+    def transfer(self, block, state):
+        """runs the block over `state`, returns the successors control can reach"""
+        successors = block.successors()
+        for op in block.operations:
+            if type(op) == Assign:
+                state[op.left.name] = self.values[op] = self.value(op.right, state)
+            elif isinstance(op, (AdditiveOperation, MultiplicativeOperation)):
+                self.values[op] = fold(op.operation, self.value(op.left, state), self.value(op.right, state))
+            elif type(op) == Condition:
+                self.values[op] = (self.value(op.left, state), self.value(op.right, state))
+            elif type(op) == MID_WHILE:
+                left, right = self.values.get(block.operations[-2], (BOTTOM, BOTTOM))
+                if TOP in (left, right):
+                    return []
+                if BOTTOM not in (left, right):
+                    successors = [block.right] if taken(op.jmp, left, right) else [block.left]
+        return successors
+
+    def run(self):
+        entry = self.flow_graph[0]
+        self.states[entry] = dict.fromkeys(self.names, BOTTOM)    # nothing is known at the start
+        worklist = [entry]
+        while worklist:
+            block = worklist.pop()
+            self.executable.add(block)
+            state = dict(self.states[block])
+            for successor in self.transfer(block, state):
+                old = self.states.get(successor)
+                new = dict(state) if old is None else {name: meet(old.get(name, TOP), value)
+                                                 for name, value in state.items()}
+                if new != old:
+                    self.states[successor] = new
+                    if successor not in worklist:
+                        worklist.append(successor)
+
+    def rewrite(self):
+        """
+            uses with known values become literals, operations computing a
+            constant are dropped, code of unreachable blocks is removed
+            (loop markers stay). Returns (uses replaced, operations folded).
+        """
+        replaced, folded = 0, 0
+        for block in self.flow_graph:
+            if block not in self.executable:
+                self.removed.update(op.left for op in block.operations if type(op) == Assign)
+                block.operations[:] = [op for op in block.operations
+                                       if type(op) in (START_WHILE, MID_WHILE, END_WHILE)]
+                continue
+            state   = dict(self.states[block])
+            dropped = set()
+            for op in block.operations:
+                if self.values.get(op) == BOTTOM and all(self.value(operand, state) not in (TOP, BOTTOM)
+                                                        for _, operand in operands(op)):
+                    continue                # a division that faults stays as it is
+                for attribute, operand in operands(op):
+                    if type(operand) in (Integer, Assign):      # an assignment has to happen anyway
+                        continue
+                    value = self.value(operand, state)
+                    if value in (TOP, BOTTOM):
+                        continue
+                    if type(operand) == Variable:
+                        op.du = [du for du in op.du if du.expression is not operand]
+                        replaced += 1
+                    else:
+                        dropped.add(operand)
+                        folded += 1
+                    setattr(op, attribute, Integer(value))
+                if type(op) == Assign:
+                    state[op.left.name] = self.value(op.right, state)
+            block.operations[:] = [op for op in block.operations if op not in dropped]
+        return replaced, folded
+
+    @staticmethod
+    def defines(op, du):
+        return type(op) == Assign and du.expression is op.left
+
+    def remove_dead_assigns(self):
+        """
+            drops assignments of literals to variables read nowhere before
+            they are written again, returns their number
+        """
+        blocks  = self.flow_graph
+        index   = {block: i for i, block in enumerate(blocks)}
+        bits    = {name: 1 << i for i, name in enumerate(self.names)}
+        successors, gen, kill = [], [], []
+        for block in blocks:
+            successors.append([index[successor] for successor in block.successors()])
+            used, defined = 0, 0
+            for op in block.operations:
+                for du in op.du:
+                    bit = bits[du.expression.name]
+                    if ConstantPropagation.defines(op, du):
+                        defined |= bit
+                    elif not defined & bit:
+                        used |= bit
+            gen.append(used)
+            kill.append(defined)
+        live_out, _ = solve(successors, gen, kill, forward=False)
+
+        removed = 0
+        for i, block in enumerate(blocks):
+            nested  = {operand for op in block.operations for _, operand in operands(op)}
+            live    = live_out[i]
+            kept    = []
+            for op in reversed(block.operations):
+                if type(op) == Assign and type(op.right) == Integer and op not in nested \
+                        and not live & bits[op.left.name]:
+                    removed += 1
+                    self.removed.add(op.left)
+                    continue
+                kept.append(op)
+                for du in op.du:
+                    if ConstantPropagation.defines(op, du):
+                        live &= ~bits[du.expression.name]
+                for du in op.du:
+                    if not ConstantPropagation.defines(op, du):
+                        live |= bits[du.expression.name]
+            block.operations[:] = reversed(kept)
+        return removed
+
+    def rebind(self):
+        """
+            A use holds the variable of the lexically latest definition of its
+            name, which gets no register once that definition is removed: such
+            uses are pointed at the variable of a definition reaching them.
+            Returns their number.
+        """
+        from operation_utils import DUGraph, DUChain
+
+        if not any(du.expression in self.removed for block in self.flow_graph
+                   for op in block.operations for du in op.du):
+            return 0
+        graph   = DUGraph.from_flowgraph(self.flow_graph)
+        rebound = 0
+        for chain in DUChain.build_chains(graph):
+            for node in chain.usages:
+                du = graph.du[node]
+                if du.expression not in self.removed:
+                    continue
+                for attribute, operand in operands(du.source):
+                    if operand is du.expression:
+                        setattr(du.source, attribute, chain.definition.expression)
+                du.expression = chain.definition.expression
+                rebound += 1
+        return rebound
+
+
+def propagate_constants(flow_graph: list):
+    """
+        Runs the pass over the flow graph in place and returns
+        (uses replaced, operations folded, assignments removed)
+    """
+    if not flow_graph:
+        return 0, 0, 0
+    propagation = ConstantPropagation(flow_graph)
+    propagation.run()
+    replaced, folded = propagation.rewrite()
+    removed = propagation.remove_dead_assigns()
+    propagation.rebind()
+    return replaced, folded, removed
@@ -0,0 +1,71 @@
+from collections import deque
+
+
+def iter_bits(mask: int):
+    """
+        Yields indices of the set bits of an int bit-vector in ascending order
+    """
+    while mask:
+        low     = mask & -mask
+        yield low.bit_length() - 1
+        mask    ^= low
+
+
+def count_bits(mask: int):
+    return bin(mask).count('1')
+
+
+def solve(successors: list, gen: list, kill: list, forward=True, boundary=0,
+          intersect=False, universe=0):
+    """
+        input:   successors - list of successor block indices for every block
+                 gen, kill  - lists of int bit-vectors (one per block)
+        output:  (inputs, outputs) - lists of int bit-vectors
+
+        Iterative worklist solver for bit-vector dataflow problems:
+            output = gen | (input & ~kill)
+        input is the union (or the intersection if `intersect` is set) of the
+        outputs of the predecessors (successors for backward problems).
+        Blocks with no predecessors get `boundary` as their input.
+        For backward problems `inputs` are the values at the block exits and
+        `outputs` are the values at the block entries.
+    """
+    count       = len(successors)
+    predecessors = [[] for _ in range(count)]
+    for block, targets in enumerate(successors):
+        for target in targets:
+            predecessors[target].append(block)
+
+    sources, targets = (predecessors, successors) if forward else (successors, predecessors)
+
+    inputs      = [0] * count
+    outputs     = [universe if intersect else 0] * count
+    order       = range(count) if forward else reversed(range(count))
+    worklist    = deque(order)
+    queued      = [True] * count
+
+    while worklist:
+        block           = worklist.popleft()
+        queued[block]   = False
+
+        if not sources[block]:
+            value = boundary
+        elif intersect:
+            value = universe
+            for source in sources[block]:
+                value &= outputs[source]
+        else:
+            value = 0
+            for source in sources[block]:
+                value |= outputs[source]
+
+        inputs[block]   = value
+        output          = gen[block] | (value & ~kill[block])
+        if output != outputs[block]:
+            outputs[block] = output
+            for target in targets[block]:
+                if not queued[target]:
+                    queued[target] = True
+                    worklist.append(target)
+
+    return inputs, outputs
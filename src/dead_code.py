@@ -0,0 +1,106 @@
+from tokens import Assign, AdditiveOperation, MultiplicativeOperation
+from operation_utils import DUGraph, DUChain, Usage
+from loop_invariants import LoopInvariants
+
+
+class DeadCodeElimination:
+    """
+        Mark and sweep over statements, a statement is an operation that is
+        no operand of another one together with the operations under it.
+        RET, loop conditions and markers and divisions that may fault are
+        needed, a statement is needed when a needed statement reads one of
+        its definitions, which is found through the du-chains. The rest is
+        removed (assignments nobody reads, with the arithmetic computing
+        their values) and so are the blocks left empty.
+    """
+
+    removable = (Assign, AdditiveOperation, MultiplicativeOperation)
+
+    def __init__(self, flow_graph: list):
+        self.flow_graph = flow_graph
+        self.statement  = {}                # operation -> root of its statement
+        self.members    = {}                # root -> operations of the statement
+
+    def split(self):
+        for block in self.flow_graph:
+            operations = set(block.operations)
+            for op in reversed(block.operations):       # parents follow their operands
+                root = self.statement.setdefault(op, op)
+                self.members.setdefault(root, []).append(op)
+                for attribute in ('left', 'right', 'expr'):
+                    child = getattr(op, attribute, None)
+                    if child in operations:
+                        self.statement[child] = root
+
+    def has_effect(self, root):
+        """does the statement have to stay whatever its definitions are used by"""
+        for op in self.members[root]:
+            if not isinstance(op, DeadCodeElimination.removable):
+                return True
+            if isinstance(op, MultiplicativeOperation) and not LoopInvariants.cannot_fault(op):
+                return True
+        return False
+
+    def mark(self):
+        """the roots of the needed statements"""
+        graph   = DUGraph.from_flowgraph(self.flow_graph)
+        reaching = {}                       # Usage -> Definitions reaching it
+        for chain in DUChain.build_chains(graph):
+            for node in chain.usages:
+                reaching.setdefault(graph.du[node], []).append(chain.definition)
+
+        needed      = set()
+        worklist    = [root for root in self.members if self.has_effect(root)]
+        while worklist:
+            root = worklist.pop()
+            if root in needed:
+                continue
+            needed.add(root)
+            for op in self.members[root]:
+                for du in op.du:
+                    if type(du) != Usage:
+                        continue
+                    for definition in reaching.get(du, []):
+                        source = self.statement[definition.source]
+                        if source not in needed:
+                            worklist.append(source)
+        return needed
+
+    def sweep(self, needed):
+        removed = 0
+        for block in self.flow_graph:
+            kept = [op for op in block.operations if self.statement[op] in needed]
+            removed += len(block.operations) - len(kept)
+            block.operations[:] = kept
+        return removed
+
+    def remove_empty_blocks(self):
+        """
+            drops the blocks without operations, whatever fell through or
+            jumped to such a block goes to the block following it. The last
+            one stays, loops exit to it
+        """
+        removed = 0
+        for block in list(self.flow_graph):
+            if block.operations or block.left is None:
+                continue
+            for other in self.flow_graph:
+                if other.left is block:
+                    other.left = block.left
+                if other.right is block:
+                    other.right = block.left
+            self.flow_graph.remove(block)
+            removed += 1
+        return removed
+
+    def run(self):
+        self.split()
+        removed = self.sweep(self.mark())
+        return removed, self.remove_empty_blocks()
+
+
+def eliminate_dead_code(flow_graph: list):
+    """runs the pass in place, returns (operations removed, blocks removed)"""
+    if not flow_graph:
+        return 0, 0
+    return DeadCodeElimination(flow_graph).run()
@@ -0,0 +1,29 @@
+class Emitter:
+    """
+        Buffered sink for the generated text: lines are collected and written
+        to `output` (a file, io.StringIO or a pipe) in chunks of about `size`
+        characters instead of a print per instruction.
+    """
+
+    def __init__(self, output, size=1 << 16):
+        self.output = output
+        self.size   = size
+        self.chunk  = []
+        self.length = 0
+
+    def line(self, text=''):
+        self.chunk.append(text)
+        self.length += len(text) + 1
+        if self.length >= self.size:
+            self.flush()
+
+    def lines(self, texts):
+        for text in texts:
+            self.line(text)
+
+    def flush(self):
+        if self.chunk:
+            self.chunk.append('')
+            self.output.write('\n'.join(self.chunk))
+            self.chunk  = []
+            self.length = 0
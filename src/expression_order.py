@@ -0,0 +1,164 @@
+from tokens import Integer, AdditiveOperation, MultiplicativeOperation, Condition
+from target import Target
+
+
+def is_node(expression):
+    """operations that compute into eax and may be reordered"""
+    if isinstance(expression, (AdditiveOperation, MultiplicativeOperation)):
+        return not (type(expression.left) == Integer and type(expression.right) == Integer)
+    return type(expression) == Condition
+
+
+def children(node):
+    return [child for child in (node.left, node.right) if is_node(child)]
+
+
+def is_tree(node):
+    """only arithmetic on variables and literals, nothing with side effects"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for child in (node.left, node.right):
+            if is_node(child):
+                stack.append(child)
+            elif child.code:
+                return False
+    return True
+
+
+def label(node, labels):
+    """
+        Sethi-Ullman number: how many results have to be kept at once
+        while the tree is computed in the accumulator (eax)
+    """
+    stack = [(node, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children(node))
+            continue
+        kids = children(node)
+        if len(kids) == 2:
+            left, right = labels[kids[0]], labels[kids[1]]
+            labels[node] = max(left, right) if left != right else left + 1
+        else:
+            labels[node] = labels[kids[0]] if kids else 0
+    return labels[node]
+
+
+def evaluation_order(node, labels, saves):
+    """
+        Operations of a tree in the order they are computed: the operand with
+        the higher label goes first. `saves` gets (first operand, node) for
+        every node with two computed operands.
+    """
+    order = []
+    stack = [(node, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            order.append(node)
+            continue
+        stack.append((node, True))
+        kids = children(node)
+        if len(kids) == 2:
+            left, right = kids
+            first, second = (right, left) if labels[right] > labels[left] else (left, right)
+            saves.append((first, node))
+            stack.append((second, False))
+            stack.append((first, False))
+        elif kids:
+            stack.append((kids[0], False))
+    return order
+
+
+def reorder_expressions(flow_graph: list, graph, registers=None):
+    """
+        Evaluation order pass over every expression tree of the flow graph:
+        the heavier (by Sethi-Ullman number) operand is computed first and
+        results that have to wait for the other operand are kept in real
+        registers free at that point, PUSH/POP is used only when there are
+        none. Runs after register allocation, `graph` is the du-graph.
+        Returns (results kept in registers, results kept in the stack).
+    """
+    registers = registers or Target().registers
+
+    du_nodes = {}                           # operation -> its du nodes
+    for node, du in enumerate(graph.du):
+        du_nodes.setdefault(du.source, []).append(node)
+
+    next_nodes  = {}                        # operation -> first du node at or after it
+    following   = None
+    for block in reversed(flow_graph):
+        for op in reversed(block.operations):
+            if op in du_nodes:
+                following = du_nodes[op][0]
+            next_nodes[op] = following
+
+    def busy(ops):
+        """real registers of the webs live anywhere in or right after ops"""
+        chains  = [chain for op in ops for node in du_nodes.get(op, []) for chain in graph.chains_at(node)]
+        after   = next_nodes.get(ops[-1])
+        if after is not None:
+            # a web defined right after the tree is not alive yet
+            chains += [chain for chain in graph.chains_at(after) if chain.definition is not graph.du[after]]
+        taken = set()
+        for chain in chains:
+            register = chain.definition.expression.register
+            if register.real:
+                taken.add(register.name)
+        return taken
+
+    in_registers, in_stack = 0, 0
+
+    for block in flow_graph:
+        operations  = block.operations
+        child_ops   = set()
+        for op in operations:
+            if is_node(op):
+                child_ops.update(children(op))
+        roots       = [op for op in operations if is_node(op) and op not in child_ops]
+        position    = {op: i for i, op in enumerate(operations)}
+
+        for tree in roots:
+            if not is_tree(tree):
+                continue
+            labels  = {}
+            saves   = []
+            label(tree, labels)
+            order   = evaluation_order(tree, labels, saves)
+
+            positions   = sorted(position[op] for op in order)
+            segment     = operations[positions[0]:positions[-1] + 1]
+            folded      = [op for op in segment if op not in labels]
+            if any(op.code for op in folded):
+                continue                    # something else is computed in between
+            operations[positions[0]:positions[-1] + 1] = folded + order
+            for i, op in enumerate(folded + order):
+                position[op] = positions[0] + i
+
+            # operands are read in a different order now, so everything
+            # the tree reads stays untouched until the tree is done
+            taken   = busy(order)
+            index   = {op: i for i, op in enumerate(order)}
+            held    = []                    # (register, first op, last op) of kept results
+            for op in order:
+                op.in_stack, op.temp = False, None
+
+            for first, parent in saves:     # outer nodes come first
+                start, end  = index[first] + 1, index[parent]
+                unavailable = taken | {register for register, outer_start, outer_end in held
+                                       if outer_start <= start and end <= outer_end}
+                if any(isinstance(op, MultiplicativeOperation) for op in order[start:end + 1]):
+                    unavailable.add('edx')  # IMUL / IDIV clobber edx
+                free = [register for register in registers if register not in unavailable]
+                if free:
+                    first.temp = free[0]
+                    held.append((free[0], start, end))
+                    in_registers += 1
+                else:
+                    first.in_stack = True
+                    in_stack += 1
+
+    return in_registers, in_stack
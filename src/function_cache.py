@@ -0,0 +1,40 @@
+import json
+import hashlib
+from collections import OrderedDict
+
+
+class FunctionCache:
+    """
+        Code of single functions kept between compilations of one process
+        (the server and batch modes): the allocated instructions and the
+        .bss slots of a function, under a hash of its tokens, the globals
+        it reads and the backend options. An edit to one function of a
+        file leaves the others to be taken from here. The least recently
+        used entries go when there are more than `limit`.
+    """
+
+    def __init__(self, limit=4096):
+        self.limit      = limit
+        self.entries    = OrderedDict()     # key -> piece, see CompilationContext.generate_unit
+        self.hits       = 0
+        self.misses     = 0
+
+    @staticmethod
+    def key(*parts):
+        """parts have to be JSON serializable"""
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key):
+        piece = self.entries.get(key)
+        if piece is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return piece
+
+    def put(self, key, piece):
+        self.entries[key] = piece
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
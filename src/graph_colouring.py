@@ -1,3 +1,6 @@
+import heapq
+
+
 def colour_graph(graph):
     """
         input    dict of {int: list}
@@ -31,6 +34,67 @@ def colour_graph(graph):
     return colours
 
 
+
+def colour_graph_briggs(graph, k, costs):
+    """
+        input    dict of {int: list}, number of real registers,
+                 dict of {int: number} (spill costs)
+        output:  dict of {int: int}
+
+        Chaitin-Briggs simplify/select with optimistic colouring.
+        Colours below k are real registers. Vertices that can't get one are
+        spilled and coloured greedily from k up, so non-interfering spilled
+        vertices share a memory slot. The cheapest vertex per remaining degree
+        is chosen as a spill candidate.
+    """
+    degree      = {vertex: len(graph[vertex]) for vertex in graph}
+    removed     = set()
+    stack       = []
+    low         = [vertex for vertex in reversed(list(graph.keys())) if degree[vertex] < k]
+    candidates  = [(costs[vertex] / (degree[vertex] + 1), vertex, degree[vertex])
+                   for vertex in graph if degree[vertex] >= k]
+    heapq.heapify(candidates)
+
+    while len(stack) < len(degree):
+        if low:
+            vertex = low.pop()
+        else:
+            _, vertex, vertex_degree = heapq.heappop(candidates)
+            if vertex in removed or degree[vertex] != vertex_degree:
+                continue                            # stale heap entry
+        removed.add(vertex)
+        stack.append(vertex)
+        for neighbour in graph[vertex]:
+            if neighbour in removed:
+                continue
+            degree[neighbour] -= 1
+            if degree[neighbour] == k - 1:
+                low.append(neighbour)
+            elif degree[neighbour] >= k:
+                heapq.heappush(candidates, (costs[neighbour] / (degree[neighbour] + 1),
+                                            neighbour, degree[neighbour]))
+
+    colours = {}
+    spilled = []
+    while stack:
+        vertex      = stack.pop()
+        adj_colours = set([colours.get(neighbor) for neighbor in graph[vertex]])
+        for i in range(k):
+            if i not in adj_colours:
+                colours[vertex] = i
+                break
+        else:
+            spilled.append(vertex)
+
+    for vertex in sorted(spilled, key=lambda vertex: costs[vertex], reverse=True):
+        adj_colours = set([colours.get(neighbor) for neighbor in graph[vertex]])
+        colour      = k
+        while colour in adj_colours:
+            colour += 1
+        colours[vertex] = colour
+
+    return colours
+
 if __name__ == '__main__':
     graph = {
         0: [1, 3],
@@ -43,5 +107,6 @@ if __name__ == '__main__':
         7: [5, 6]
     }
     print(colour_graph(graph))  # {3: 0, 0: 1, 1: 0, 4: 1, 5: 0, 6: 1, 7: 2, 2: 1}
+    print(colour_graph_briggs(graph, 2, {vertex: 1 for vertex in graph}))  # {6: 0, 7: 1, 1: 0, 4: 1, 3: 0, 0: 1, 2: 1, 5: 2}
     
     
@@ -0,0 +1,60 @@
+class Instruction:
+    """
+        One line of the emitted code. Operands are kept as their NASM text:
+        registers ('eax'), memory ('dword [s0]'), immediates ('4') or labels.
+    """
+
+    def __init__(self, opcode, *operands):
+        self.opcode     = opcode.upper()
+        self.operands   = [str(operand) for operand in operands]
+
+    def __eq__(self, other):
+        return type(other) == Instruction and self.opcode == other.opcode \
+            and self.operands == other.operands
+
+    def __hash__(self):
+        return hash((self.opcode, tuple(self.operands)))
+
+    def __repr__(self):
+        if not self.operands:
+            return f'\t{self.opcode}'
+        return f'\t{self.opcode} ' + ',\t'.join(self.operands)
+
+
+class Label:
+
+    def __init__(self, name):
+        self.name       = name
+        self.opcode     = None
+        self.operands   = []
+
+    def __eq__(self, other):
+        return type(other) == Label and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f'\t{self.name}:'
+
+
+registers   = ['eax', 'ebx', 'ecx', 'edx', 'esi', 'edi', 'esp', 'ebp']
+jumps       = ['JMP', 'JE', 'JNE', 'JL', 'JLE', 'JG', 'JGE']
+inverted    = {'JE': 'JNE', 'JNE': 'JE', 'JL': 'JGE', 'JGE': 'JL', 'JG': 'JLE', 'JLE': 'JG'}
+
+
+def is_register(operand):
+    return operand in registers
+
+
+def is_memory(operand):
+    return operand.startswith('dword [')
+
+
+def is_immediate(operand):
+    return operand.lstrip('-').isdigit()
+
+
+def render(instructions):
+    """NASM text of an instruction list, a line each"""
+    return ''.join(f'{instruction}\n' for instruction in instructions)
@@ -0,0 +1,300 @@
+import re
+import sys
+import json
+import argparse
+
+
+class ExecutionError(Exception):
+    """Error while running the generated code"""
+    def __init__(self, message, line=None):
+        self.line       = line
+        self.message    = f'line {line}: {message}' if line else message
+        super().__init__(self.message)
+
+
+class Instruction:
+
+    def __init__(self, opcode, operands, line):
+        self.opcode     = opcode            # upper case mnemonic
+        self.operands   = operands          # register names, ('mem', name) or ints
+        self.line       = line
+
+    def __repr__(self):
+        return f'{self.opcode} {", ".join(map(str, self.operands))}'
+
+
+class Program:
+    """
+        The subset of NASM the compiler emits: .bss cells declared with
+        `resd`, labels and one instruction per line. Comments, %include,
+        section and global lines are skipped.
+    """
+
+    registers   = ['eax', 'ebx', 'ecx', 'edx', 'esi', 'edi', 'esp', 'ebp']
+    memory_re   = re.compile(r'dword\s*\[\s*(\w+)\s*\]', re.IGNORECASE)
+    address_re  = re.compile(r'\[\s*(\w+)\s*\+\s*(\w+)\s*\*\s*(\d)\s*\]', re.IGNORECASE)
+
+    def __init__(self, text):
+        self.instructions   = []
+        self.labels         = {}            # label -> index of the next instruction
+        self.cells          = []            # .bss names
+        self.entry          = 0
+
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.split(';', 1)[0].strip()
+            if not line or line.startswith('%') or line.split()[0].lower() in ('section', 'global'):
+                continue
+            declaration = re.match(r'(\w+)\s*:\s*resd\s+(\d+)$', line, re.IGNORECASE)
+            if declaration:
+                self.cells.append(declaration.group(1))
+                continue
+            if line.endswith(':'):
+                self.labels[line[:-1]] = len(self.instructions)
+                continue
+            opcode, _, rest = re.sub(r'\s+', ' ', line).partition(' ')
+            operands = [Program.operand(text.strip(), number) for text in rest.split(',') if text.strip()]
+            self.instructions.append(Instruction(opcode.upper(), operands, number))
+
+        self.entry = self.labels.get('CMAIN', 0)
+
+    @staticmethod
+    def operand(text, line):
+        memory = Program.memory_re.fullmatch(text)
+        if memory:
+            return ('mem', memory.group(1))
+        address = Program.address_re.fullmatch(text)
+        if address:                         # [base+index*scale], only LEA takes it
+            return ('address', address.group(1).lower(), address.group(2).lower(), int(address.group(3)))
+        if text.lower() in Program.registers:
+            return text.lower()
+        try:
+            return int(text, 0)
+        except ValueError:
+            return text                     # a label
+
+
+class Machine:
+    """
+        Runs a Program from CMAIN to its RET and counts what
+        the code costs: executed instructions, memory loads and stores,
+        jumps (and how many of them were taken) and an estimate of cycles from the `costs` table (latencies of a simple
+        in-order core, a memory operand adds `memory_cost`).
+    """
+
+    costs       = {'MOV': 1, 'ADD': 1, 'SUB': 1, 'CMP': 1, 'XOR': 1, 'AND': 1, 'NEG': 1, 'XCHG': 2,
+                   'CDQ': 1, 'SHL': 1, 'SAR': 1, 'SHR': 1, 'LEA': 1, 'PUSH': 1, 'POP': 1, 'IMUL': 3,
+                   'IDIV': 25, 'JMP': 1, 'RET': 2}
+    jump_cost   = 1                         # conditional jump, +1 when taken
+    memory_cost = 3                         # per load, a store costs `store_cost`
+    store_cost  = 1
+    jumps       = {
+        'JE':   lambda flags: flags['zf'],
+        'JNE':  lambda flags: not flags['zf'],
+        'JL':   lambda flags: flags['sf'] != flags['of'],
+        'JGE':  lambda flags: flags['sf'] == flags['of'],
+        'JG':   lambda flags: not flags['zf'] and flags['sf'] == flags['of'],
+        'JLE':  lambda flags: flags['zf'] or flags['sf'] != flags['of'],
+    }
+
+    def __init__(self, program: Program):
+        self.program    = program
+        self.registers  = dict.fromkeys(Program.registers, 0)
+        self.registers['esp'] = 0x100000
+        self.memory     = dict.fromkeys(program.cells, 0)
+        self.stack      = []
+        self.flags      = {'zf': False, 'sf': False, 'of': False}
+        self.counts     = {'instructions': 0, 'loads': 0, 'stores': 0, 'cycles': 0, 'jumps': 0, 'taken': 0}
+        self.opcodes    = {}
+
+    @staticmethod
+    def wrap(value):
+        """two's complement 32-bit value of an int"""
+        value &= 0xFFFFFFFF
+        return value - 0x100000000 if value & 0x80000000 else value
+
+    def read(self, operand, line):
+        if isinstance(operand, int):
+            return Machine.wrap(operand)
+        if isinstance(operand, tuple):
+            if operand[1] not in self.memory:
+                raise ExecutionError(f'unknown memory cell {operand[1]}', line)
+            self.counts['loads']  += 1
+            self.counts['cycles'] += Machine.memory_cost
+            return self.memory[operand[1]]
+        if operand in self.registers:
+            return self.registers[operand]
+        raise ExecutionError(f'bad operand {operand}', line)
+
+    def write(self, operand, value, line):
+        value = Machine.wrap(value)
+        if isinstance(operand, tuple):
+            if operand[1] not in self.memory:
+                raise ExecutionError(f'unknown memory cell {operand[1]}', line)
+            self.counts['stores'] += 1
+            self.counts['cycles'] += Machine.store_cost
+            self.memory[operand[1]] = value
+        elif operand in self.registers:
+            self.registers[operand] = value
+        else:
+            raise ExecutionError(f'cannot write to {operand}', line)
+
+    def set_flags(self, exact):
+        """flags of an add / sub whose mathematical result is `exact`"""
+        result = Machine.wrap(exact)
+        self.flags['zf'] = result == 0
+        self.flags['sf'] = result < 0
+        self.flags['of'] = result != exact
+        return result
+
+    def push(self, value):
+        self.stack.append(value)
+        self.registers['esp'] -= 4
+        self.counts['stores'] += 1
+
+    def pop(self, line):
+        if not self.stack:
+            raise ExecutionError('POP from an empty stack', line)
+        self.registers['esp'] += 4
+        self.counts['loads'] += 1
+        return self.stack.pop()
+
+    def run(self, max_steps=10 ** 7):
+        """executes the program, returns the report (see `report`)"""
+        instructions    = self.program.instructions
+        pc              = self.program.entry
+
+        while True:
+            if pc >= len(instructions):
+                raise ExecutionError('fell off the end of the code without RET')
+            if self.counts['instructions'] >= max_steps:
+                raise ExecutionError(f'no RET after {max_steps} instructions')
+
+            instruction = instructions[pc]
+            opcode, operands, line = instruction.opcode, instruction.operands, instruction.line
+            self.counts['instructions'] += 1
+            self.opcodes[opcode] = self.opcodes.get(opcode, 0) + 1
+            self.counts['cycles'] += Machine.costs.get(opcode, Machine.jump_cost)
+            pc += 1
+
+            if opcode == 'MOV':
+                self.write(operands[0], self.read(operands[1], line), line)
+            elif opcode in ('ADD', 'SUB'):
+                left, right = self.read(operands[0], line), self.read(operands[1], line)
+                exact = left + right if opcode == 'ADD' else left - right
+                self.write(operands[0], self.set_flags(exact), line)
+            elif opcode == 'CMP':
+                self.set_flags(self.read(operands[0], line) - self.read(operands[1], line))
+            elif opcode == 'XOR':
+                result = self.read(operands[0], line) ^ self.read(operands[1], line)
+                self.write(operands[0], self.set_flags(result), line)
+                self.flags['of'] = False
+            elif opcode == 'AND':
+                result = self.read(operands[0], line) & self.read(operands[1], line)
+                self.write(operands[0], self.set_flags(result), line)
+                self.flags['of'] = False
+            elif opcode == 'NEG':
+                self.write(operands[0], self.set_flags(-self.read(operands[0], line)), line)
+            elif opcode in ('SHL', 'SAR', 'SHR'):
+                value, count = self.read(operands[0], line), self.read(operands[1], line) & 31
+                if opcode == 'SHL':
+                    result = value << count
+                elif opcode == 'SAR':
+                    result = value >> count
+                else:
+                    result = (value & 0xFFFFFFFF) >> count
+                self.write(operands[0], self.set_flags(Machine.wrap(result)), line)
+            elif opcode == 'LEA':
+                if not isinstance(operands[1], tuple) or operands[1][0] != 'address':
+                    raise ExecutionError('LEA needs a [base+index*scale] address', line)
+                _, base, index, scale = operands[1]
+                value = self.registers[base] + self.registers[index] * scale
+                self.write(operands[0], value, line)
+            elif opcode == 'XCHG':
+                left, right = self.read(operands[0], line), self.read(operands[1], line)
+                self.write(operands[0], right, line)
+                self.write(operands[1], left, line)
+            elif opcode == 'CDQ':
+                self.registers['edx'] = -1 if self.registers['eax'] < 0 else 0
+            elif opcode == 'IMUL':
+                if len(operands) != 1:
+                    raise ExecutionError('only the one-operand IMUL is supported', line)
+                product = self.registers['eax'] * self.read(operands[0], line)
+                self.registers['eax'] = Machine.wrap(product)
+                self.registers['edx'] = Machine.wrap(product >> 32)
+            elif opcode == 'IDIV':
+                divisor  = self.read(operands[0], line)
+                dividend = (self.registers['edx'] << 32) | (self.registers['eax'] & 0xFFFFFFFF)
+                if divisor == 0:
+                    raise ExecutionError('division by zero', line)
+                quotient = abs(dividend) // abs(divisor)
+                quotient = quotient if (dividend < 0) == (divisor < 0) else -quotient
+                if Machine.wrap(quotient) != quotient:
+                    raise ExecutionError('quotient does not fit in eax', line)
+                self.registers['eax'] = quotient
+                self.registers['edx'] = Machine.wrap(dividend - quotient * divisor)
+            elif opcode == 'PUSH':
+                self.push(self.read(operands[0], line))
+            elif opcode == 'POP':
+                self.write(operands[0], self.pop(line), line)
+            elif opcode == 'JMP':
+                pc = self.target(operands[0], line)
+                self.counts['jumps'] += 1
+                self.counts['taken'] += 1
+            elif opcode in Machine.jumps:
+                self.counts['jumps'] += 1
+                if Machine.jumps[opcode](self.flags):
+                    pc = self.target(operands[0], line)
+                    self.counts['cycles'] += 1
+                    self.counts['taken'] += 1
+            elif opcode == 'RET':                 # there are no calls, RET leaves CMAIN
+                if self.stack:
+                    raise ExecutionError(f'RET with {len(self.stack)} values left on the stack', line)
+                return self.report()
+            else:
+                raise ExecutionError(f'unsupported instruction {instruction}', line)
+
+    def target(self, label, line):
+        if label not in self.program.labels:
+            raise ExecutionError(f'unknown label {label}', line)
+        return self.program.labels[label]
+
+    def report(self):
+        return dict(self.counts, result=self.registers['eax'], registers=dict(self.registers),
+                    memory=dict(self.memory), opcodes=self.opcodes)
+
+
+def run_file(path, max_steps=10 ** 7):
+    with open(path) as asm:
+        return Machine(Program(asm.read())).run(max_steps)
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='runs the .asm the compiler emits and counts its cost')
+    arg_parser.add_argument('asm', nargs='+', help='compiled .asm files')
+    arg_parser.add_argument('--max-steps', type=int, default=10 ** 7,
+                            help='stop after this many instructions (default: 10**7)')
+    arg_parser.add_argument('--json', action='store_true', help='print a JSON line per file')
+    args = arg_parser.parse_args(argv[1:])
+
+    failed = False
+    for path in args.asm:
+        try:
+            report = run_file(path, args.max_steps)
+        except ExecutionError as error:
+            print(f'{path}: {error.message}', file=sys.stderr)
+            failed = True
+            continue
+        if args.json:
+            print(json.dumps(dict(report, file=path)))
+            continue
+        print(f'{path}: returned {report["result"]}')
+        print(f'\tinstructions: {report["instructions"]}, loads: {report["loads"]}, '
+              f'stores: {report["stores"]}, cycles: {report["cycles"]}, '
+              f'jumps: {report["jumps"]} ({report["taken"]} taken)')
+        print('\t' + ', '.join(f'{name}={value}' for name, value in report['registers'].items()))
+        if report['memory']:
+            print('\t' + ', '.join(f'{name}={value}' for name, value in report['memory'].items()))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main(sys.argv)
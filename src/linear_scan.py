@@ -0,0 +1,117 @@
+import heapq
+from loop_invariants import loops
+from target import Target
+from operation_utils import Web
+
+
+class LinearScan:
+    """
+        Linear scan register allocation (Poletto and Sarkar): a web lives
+        from the first to the last du node it is alive at in the linearized
+        flow graph. A web alive on the way into a loop stays alive until the
+        end of the loop, since END_WHILE jumps back to the header. No
+        interference graph is built, intervals are allocated in the order of
+        their starts and the one ending last is spilled when the real
+        registers run out. Constraints of the target keep a web out of the
+        registers clobbered while it is alive.
+    """
+
+    def __init__(self, graph, webs: list, flow_graph: list, target=None, constraints=None):
+        self.inverse_mapping    = dict(enumerate(webs))
+        self.intervals          = LinearScan.live_intervals(graph, webs, flow_graph)
+        self.target             = target or Target()
+        self.forbidden          = {web: {self.target.registers.index(register) for register in registers}
+                                   for web, registers in Target.forbidden(webs, constraints or {}).items()}
+
+    @staticmethod
+    def live_intervals(graph, webs: list, flow_graph: list):
+        """[(start, end, web index)] sorted by start, positions are du node numbers"""
+        owners      = Web.chain_webs(webs)
+        start, end  = {}, {}
+        positions   = {}                    # block -> (first, last) position of its nodes
+        for position, du in enumerate(graph.du):
+            for chain_idx in graph.live(position):
+                web = owners[chain_idx]
+                start.setdefault(web, position)
+                end[web] = position
+            first, _ = positions.get(du.block, (position, position))
+            positions[du.block] = (first, position)
+
+        blocks = {block: i for i, block in enumerate(flow_graph)}
+        for header, last in loops(flow_graph):
+            spans = [positions[block] for block in flow_graph[blocks[header]:blocks[last] + 1]
+                     if block in positions]
+            if not spans:
+                continue
+            first, last = spans[0][0], spans[-1][1]
+            for web in start:
+                if start[web] < first <= end[web]:
+                    end[web] = max(end[web], last)
+
+        return sorted((start[web], end[web], web) for web in start)
+
+    @staticmethod
+    def scan(intervals, count=None, forbidden=None):
+        """
+            {web index: register index} for `count` registers and the list
+            of the webs left without one. Without `count` nothing is spilled.
+            `forbidden` is {web index: register indices it can't be given}.
+        """
+        forbidden   = forbidden or {}
+        free        = list(range(count))[::-1] if count is not None else []
+        created     = 0                     # registers made up so far without `count`
+        active      = []                    # heap of (end, web)
+        assigned    = {}
+        spilled     = []
+        for start, end, web in intervals:
+            while active and active[0][0] < start:
+                _, expired = heapq.heappop(active)
+                free.append(assigned[expired])      # the latest freed is taken first, copies often share it
+            if not free and count is None:
+                free.append(created)
+                created += 1
+            allowed = [i for i in range(len(free)) if free[i] not in forbidden.get(web, ())]
+            if allowed:
+                assigned[web] = free.pop(allowed[-1])
+                heapq.heappush(active, (end, web))
+                continue
+            victims = [interval for interval in active if assigned[interval[1]] not in forbidden.get(web, ())]
+            furthest = max(victims) if victims else (end, web)
+            if furthest[0] > end:
+                active.remove(furthest)
+                heapq.heapify(active)
+                assigned[web] = assigned.pop(furthest[1])
+                heapq.heappush(active, (end, web))
+                spilled.append(furthest[1])
+            else:
+                spilled.append(web)
+        return assigned, spilled
+
+    def colour(self):
+        """
+            the same (colour_lists, priorities, registers) as
+            InterferenceGraph.colour, a colour is a register index here
+        """
+        k                   = len(self.target.registers)
+        assigned, spilled   = LinearScan.scan(self.intervals, k, self.forbidden)
+        spilled             = set(spilled)
+        slots, _            = LinearScan.scan([interval for interval in self.intervals if interval[2] in spilled])
+
+        colour_lists = {}
+        for web, register in assigned.items():
+            colour_lists.setdefault(register, []).append(web)
+        for web, slot in slots.items():
+            colour_lists.setdefault(k + slot, []).append(web)
+
+        registers   = self.target.registers + [f's{i}' for i in range(len(set(slots.values())))]
+        priorities  = list(range(len(registers)))
+        for colour in priorities:
+            colour_lists.setdefault(colour, [])
+        return colour_lists, priorities, registers
+
+    def allocate(self, colour_lists, priorities, registers):
+        for colour, register in zip(priorities, registers):
+            for web_idx in colour_lists[colour]:
+                for chain in self.inverse_mapping[web_idx].chains:
+                    chain.definition.expression.register.name = register
+                    chain.definition.expression.register.real = register in self.target.registers
@@ -0,0 +1,117 @@
+from tokens import Integer, Variable, Assign, AdditiveOperation, MultiplicativeOperation, \
+    START_WHILE, END_WHILE
+from operation_utils import BasicBlock, Definition, Usage
+
+
+def is_operation(expression):
+    return isinstance(expression, (AdditiveOperation, MultiplicativeOperation))
+
+
+def loops(flow_graph: list):
+    """(header block, block with the END_WHILE) of every loop, outer loops first"""
+    headers = {}                            # loop_id -> header block
+    found   = []
+    for block in flow_graph:
+        for op in block.operations:
+            if type(op) == START_WHILE:
+                headers[op.loop_id] = block
+                found.append(op.loop_id)
+            elif type(op) == END_WHILE:
+                headers[op.loop_id] = (headers[op.loop_id], block)
+    return [headers[loop_id] for loop_id in found]
+
+
+class LoopInvariants:
+    """
+        Loop-invariant code motion: an arithmetic tree inside a loop whose
+        variables are defined nowhere in the loop (by the Definitions of the
+        du information) is computed once in a preheader block in front of
+        the loop header and kept in a new variable the loop reads.
+    """
+
+    def __init__(self, flow_graph: list, eax):
+        self.flow_graph = flow_graph
+        self.eax        = eax
+        self.hoisted    = 0                 # number of trees moved out
+
+    def hoist(self):
+        for header, end in loops(self.flow_graph):
+            self.hoist_loop(self.flow_graph.index(header), self.flow_graph.index(end))
+        return self.hoisted
+
+    def hoist_loop(self, header, end):
+        blocks  = self.flow_graph[header:end + 1]
+        defined = {du.expression.name for block in blocks for op in block.operations
+                   for du in op.du if type(du) == Definition}
+        invariant = {}
+
+        def is_invariant(operand):
+            if type(operand) == Integer:
+                return True
+            if type(operand) == Variable:
+                return operand.name not in defined
+            return invariant.get(operand, False)
+
+        parents = {}
+        for block in blocks:
+            for op in block.operations:
+                for attribute in ('left', 'right', 'expr'):
+                    child = getattr(op, attribute, None)
+                    if is_operation(child):
+                        parents[child] = (op, attribute)
+                if is_operation(op):
+                    invariant[op] = is_invariant(op.left) and is_invariant(op.right) \
+                        and (block is blocks[0] or LoopInvariants.cannot_fault(op))
+
+        roots = [op for op in invariant if invariant[op] and op in parents
+                 and not invariant.get(parents[op][0], False) and LoopInvariants.worth(op)]
+        if not roots:
+            return
+
+        preheader = BasicBlock.insert_preheader(self.flow_graph, header)
+        for root in roots:
+            tree = LoopInvariants.subtree(root)
+            for block in blocks:
+                moved = [op for op in block.operations if op in tree]
+                block.operations[:] = [op for op in block.operations if op not in tree]
+                preheader.operations += moved
+
+            root.in_stack, root.temp = False, None
+            variable = Variable(f'__invariant_{self.hoisted}')
+            preheader.add(Assign(variable, root, self.eax))
+
+            parent, attribute = parents[root]
+            setattr(parent, attribute, variable)
+            parent.du.append(Usage(variable, parent))
+            if attribute == 'right':
+                parent.left.in_stack = False    # nothing is computed after the left operand now
+            self.hoisted += 1
+
+    @staticmethod
+    def cannot_fault(op):
+        """only IDIV traps, by a literal divisor other than 0 and -1 it can't"""
+        if op.operation != 'IDIV':
+            return True
+        return type(op.right) == Integer and op.right._value not in (0, -1)
+
+    @staticmethod
+    def worth(op):
+        """a single ADD / SUB costs as much as reading its result back"""
+        tree = LoopInvariants.subtree(op)
+        if type(op.left) == Integer and type(op.right) == Integer:
+            return False
+        return len(tree) > 1 or isinstance(op, MultiplicativeOperation)
+
+    @staticmethod
+    def subtree(op):
+        tree, stack = set(), [op]
+        while stack:
+            op = stack.pop()
+            tree.add(op)
+            stack.extend(child for child in (op.left, op.right) if is_operation(child))
+        return tree
+
+
+def hoist_invariants(flow_graph: list, eax):
+    """moves loop invariant trees to preheaders in place, returns their number"""
+    return LoopInvariants(flow_graph, eax).hoist()
@@ -1,4 +1,12 @@
-from graph_colouring import colour_graph
+from graph_colouring import colour_graph, colour_graph_briggs
+from dataflow import solve, iter_bits, count_bits
+from collections.abc import Mapping
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class BasicBlock:
 
@@ -10,15 +18,61 @@ class BasicBlock:
 
     def add(self, element):
         self.operations.append(element)
+
+    def successors(self):
+        """
+            blocks control can go to: a loop header goes to the body (left) or
+            out of the loop (right), the last block of a body jumps back only
+        """
+        from tokens import END_WHILE
+
+        if self.operations and type(self.operations[-1]) == END_WHILE:
+            return [self.right]
+        return [block for block in (self.left, self.right) if block is not None]
+
+    @staticmethod
+    def insert_preheader(flowgraph: list, header):
+        """
+            a new empty block in front of the loop header at index `header`,
+            the block before it falls through to the preheader now
+        """
+        preheader = BasicBlock(left=flowgraph[header])
+        flowgraph[header - 1].left = preheader
+        flowgraph.insert(header, preheader)
+        return preheader
+
+    @staticmethod
+    def loop_depths(flowgraph: list):
+        """
+            {BasicBlock: number of enclosing while loops}, derived from
+            START_WHILE / END_WHILE nesting
+        """
+        from tokens import START_WHILE, END_WHILE
+
+        depths  = {}
+        depth   = 0
+        for block in flowgraph:
+            for op in block.operations:
+                if type(op) == START_WHILE:
+                    depth += 1
+            depths[block] = depth
+            for op in block.operations:
+                if type(op) == END_WHILE:
+                    depth -= 1
+        return depths
         
 
 class DU:
+    __slots__ = ('source', 'expression', 'block')
+
     def __init__(self, expression, source):
         self.source     = source
         self.expression = expression
         self.block      = None
 
 class Definition(DU):
+    __slots__ = ('symbol',)
+
     def __init__(self, expression, source):
         super().__init__(expression, source)
         self.symbol = expression.name
@@ -28,6 +82,8 @@ class Definition(DU):
 
 
 class Usage(DU):
+    __slots__ = ()
+
     def __init__(self, expression, source):
         super().__init__(expression, source)
 
@@ -35,169 +91,543 @@ class Usage(DU):
         return f'<use {self.expression.name}>'
 
 
-class DUNode:
-    def __init__(self, du: DU, left=None, right=None):
-        self.left   = left
-        self.right  = right
-        self.du     = du
-        self.chains = set()
-    
+class DUGraph:
+    """
+        The du nodes of a flow graph in program order, node i is followed by
+        node i + 1. A node is its index into parallel arrays rather than an
+        object: `du[i]` is its definition or usage, its jumps (loop back edges
+        and loop exits) are `jump_targets[jump_start[i]:jump_start[i + 1]]`
+        and the chains it belongs to are the indices into `chains` in
+        `live_chains[live_start[i]:live_start[i + 1]]`, see DUChain.build_chains
+    """
+    __slots__ = ('du', 'jump_start', 'jump_targets', 'live_start', 'live_chains', 'chains')
+
+    def __init__(self, dus: list, jumps: dict):
+        self.du             = dus
+        self.jump_start     = array('i', [0])
+        self.jump_targets   = array('i')
+        for node in range(len(dus)):
+            self.jump_targets.extend(jumps.get(node, ()))
+            self.jump_start.append(len(self.jump_targets))
+        self.live_start     = array('i', [0]) * (len(dus) + 1)
+        self.live_chains    = array('i')
+        self.chains         = []            # all the chains, filled by DUChain.build_chains
+
+    def __len__(self):
+        return len(self.du)
+
+    def jumps(self, node: int):
+        return self.jump_targets[self.jump_start[node]:self.jump_start[node + 1]]
+
+    def live(self, node: int):
+        """indices of the chains the node belongs to"""
+        return self.live_chains[self.live_start[node]:self.live_start[node + 1]]
+
+    def chains_at(self, node: int):
+        chains = self.chains
+        return [chains[i] for i in self.live(node)]
+
     # can't handle conditional statements yet
     @staticmethod
     def from_flowgraph(flowgraph: list):
-
-        root        = None
-        prev        = None
-        first_nodes = {}
+        """
+            Nodes of all the blocks in program order, a block jumping to
+            block.right adds a jump from its last node (or the last one before
+            it if the block has none) to the first node at or after the start
+            of block.right
+        """
+        dus     = []
+        first   = {}                        # block -> index of the first node at or after its start
+        last    = {}                        # block -> index of the last node up to its end
 
         for block in flowgraph:
             if block == None:
                 break
-            du_list = sum([op.du for op in block.operations], [])
-            for i in range(len(du_list)):
-                du          = du_list[i]
-                du.block    = block
-                node        = DUNode(du)
-                if i == 0:
-                    first_nodes[block] = node
-                    if root == None:
-                        root = node
-                if prev:
-                    prev.left = node
-                if i == len(du_list) - 1:
-                    node.right = first_nodes[block.right] if block.right else None
-                    # print(f'Node right: {node.right}, node: {node.du}')
-                prev = node
-    
-        return root
+            first[block] = len(dus)
+            for op in block.operations:
+                for du in op.du:
+                    du.block = block
+                    dus.append(du)
+            last[block] = len(dus) - 1
+
+        jumps   = {}                        # node -> its jump targets
+        for block in last:
+            if block.right not in first:
+                continue
+            source, target = last[block], first[block.right]
+            if source < 0 or target >= len(dus) or target == source + 1:
+                continue
+            targets = jumps.setdefault(source, [])
+            if target not in targets:
+                targets.append(target)
+
+        return DUGraph(dus, jumps)
+
+    # maximal runs of nodes from the same BasicBlock
+    def blocks(self):
+        blocks  = []
+        start   = 0
+        dus     = self.du
+        for node in range(1, len(dus) + 1):
+            if node == len(dus) or dus[node].block is not dus[start].block:
+                blocks.append(range(start, node))
+                start = node
+        return blocks
 
     def __repr__(self):
-        return f'[node {self.du} l:{self.left.du if self.left else None} r:{self.right.du if self.right else None}]'
+        return f'[du graph {len(self.du)} nodes {len(self.chains)} chains]'
 
 
 class DUChain:
-    def __init__(self, symbol, definition):
+    __slots__ = ('symbol', 'definition', 'node', 'usages', 'index')
+
+    def __init__(self, symbol, definition, index=None, node=None):
         self.symbol     = symbol
         self.definition = definition
-        self.web        = None
-        self.usages     = []
+        self.node       = node              # du node of the definition
+        self.usages     = array('i')        # du nodes of the usages
+        self.index      = index             # position in the list of all the chains
 
     def __and__(self, other):
         return set(self.usages) & set(other.usages)
         
     def __repr__(self):
-        return f'<{self.symbol} {self.usages}>' 
+        return f'<{self.symbol} {list(self.usages)}>' 
 
     @staticmethod
-    def build_chains(du_list: DUNode):
-
-        def get_usages(chain: DUChain, du_node: DUNode, visited_nodes: set): 
-            if  not du_node \
-                or type(du_node.du) == Definition and du_node.du.expression.name == chain.symbol \
-                or du_node in visited_nodes:
-
-                return []
-            right = get_usages(chain, du_node.right, visited_nodes | {du_node})
-            # print(f'right: {right}')
-            left = get_usages(chain, du_node.left, visited_nodes | {du_node})
-            if left or right or du_node.du.expression.name == chain.symbol:
-                du_node.chains.add(chain)
-            return ([du_node] if du_node.du.expression.name == chain.symbol else []) + left + right
+    def build_chains(graph: DUGraph):
+        """
+            Reaching definitions and liveness are computed over the blocks of
+            the du-graph with an iterative worklist (see dataflow.py).
+            A usage belongs to every chain whose definition reaches it, a node
+            belongs to (graph.live) every chain that reaches it while its
+            symbol is still live and a definition node also belongs to its own
+            chain.
+        """
+
+        dus     = graph.du
+        blocks  = graph.blocks()
+        starts  = {block.start: i for i, block in enumerate(blocks)}
 
         du_chains   = []
-        node        = du_list
-
-        while node:
-            if type(node.du) == Definition:
-                chain           = DUChain(node.du.symbol, node.du)
-                left            = get_usages(chain, node.left, set()) 
-                right           = get_usages(chain, node.right, set()) 
-                chain.usages    = left + right
-                du_chains.append(chain)
-            node = node.left 
+        symbols     = {}                        # symbol -> bit in liveness vectors
+        sym_names   = []                        # bit index -> symbol
+        sym_defs    = {}                        # symbol -> bit-vector of its definitions
+        for node, du in enumerate(dus):
+            symbol = du.expression.name
+            if symbol not in symbols:
+                symbols[symbol]     = 1 << len(sym_names)
+                sym_defs[symbol]    = 0
+                sym_names.append(symbol)
+            if type(du) == Definition:
+                sym_defs[symbol] |= 1 << len(du_chains)
+                du_chains.append(DUChain(du.symbol, du, len(du_chains), node))
+
+        successors  = []
+        rd_gen, rd_kill     = [], []            # reaching definitions
+        lv_gen, lv_kill     = [], []            # live symbols
+        def_idx     = 0
+        for block in blocks:
+            last = block[-1]
+            following = (last + 1,) if last + 1 < len(dus) else ()
+            successors.append([starts[node] for node in (*following, *graph.jumps(last))])
+
+            gen, kill, use, defined = 0, 0, 0, 0
+            for node in block:
+                du      = dus[node]
+                symbol  = du.expression.name
+                if type(du) == Definition:
+                    gen     = (gen & ~sym_defs[symbol]) | (1 << def_idx)
+                    kill    |= sym_defs[symbol]
+                    defined |= symbols[symbol]
+                    def_idx += 1
+                elif not defined & symbols[symbol]:
+                    use     |= symbols[symbol]
+            rd_gen.append(gen)
+            rd_kill.append(kill)
+            lv_gen.append(use)
+            lv_kill.append(defined)
+
+        reaching, _ = solve(successors, rd_gen, rd_kill)
+        live_out, _ = solve(successors, lv_gen, lv_kill, forward=False)
+
+        live_start  = graph.live_start
+        live_chains = graph.live_chains
+        def_idx = 0
+        for i, block in enumerate(blocks):
+            live        = live_out[i]
+            live_in     = []
+            for node in reversed(block):
+                du = dus[node]
+                if type(du) == Definition:
+                    live &= ~symbols[du.expression.name]
+                else:
+                    live |= symbols[du.expression.name]
+                live_in.append(live)
+            live_in.reverse()
+
+            rd      = reaching[i]
+            current = {}                        # symbol -> its definitions reaching the node
+            for node, live in zip(block, live_in):
+                for bit in iter_bits(live):
+                    symbol = sym_names[bit]
+                    if symbol not in current:
+                        current[symbol] = rd & sym_defs[symbol]
+                    live_chains.extend(iter_bits(current[symbol]))
+
+                du      = dus[node]
+                symbol  = du.expression.name
+                if type(du) == Definition:
+                    live_chains.append(def_idx) # the register is written even if the value is dead
+                    current[symbol] = 1 << def_idx
+                    def_idx += 1
+                else:
+                    if symbol not in current:
+                        current[symbol] = rd & sym_defs[symbol]
+                    for chain_idx in iter_bits(current[symbol]):
+                        du_chains[chain_idx].usages.append(node)
+                live_start[node + 1] = len(live_chains)
 
+        graph.chains = du_chains
         return du_chains
   
 
+class DisjointSet:
+    """
+        Union-find over 0..size-1 with path compression and union by size
+    """
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size   = [1] * size
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, item_1, item_2):
+        root_1, root_2 = self.find(item_1), self.find(item_2)
+        if root_1 == root_2:
+            return root_1
+        if self.size[root_1] < self.size[root_2]:
+            root_1, root_2 = root_2, root_1
+        self.parent[root_2] = root_1
+        self.size[root_1]   += self.size[root_2]
+        return root_1
+
+
 class Web:
-    def __init__(self, *chains, main_nodes=None):
-        self.nodes      = set()
+    __slots__ = ('chains',)
+
+    def __init__(self, *chains):
         self.chains     = chains
-        for chain in chains:
-            self.nodes  = self.nodes | set(chain.usages) | {chain.definition}
 
-    # CHECKME
+    @property
+    def nodes(self):
+        """du nodes of the definitions and the usages of the chains"""
+        nodes = {chain.node for chain in self.chains}
+        for chain in self.chains:
+            nodes.update(chain.usages)
+        return nodes
+
     def __add__(self, other):
-        new_web = Web()
-        new_web.chains  = self.chains + other.chains
-        new_web.nodes   = self.nodes.union(other.nodes)
-        
-        return new_web
+        return Web(*self.chains, *other.chains)
     
     @staticmethod
     def from_chains(chains: list):
+        """
+            Chains sharing a usage node are joined into one web (transitively).
+            Webs are ordered by their first chain, chains keep their order.
+        """
 
-        webs = [Web(chain) for chain in chains]
-        idx_1 = 0
-
-        while idx_1 < len(webs):
-            idx_2 = idx_1
-            while idx_2 < len(webs):
-                if idx_1 != idx_2 and set(webs[idx_1].nodes) & set(webs[idx_2].nodes):
-                    # print(f'; JOINT {idx_1} {idx_2}')
-                    new_web     = webs[idx_1] + webs[idx_2]
-                    webs[idx_1] = new_web
-                    del webs[idx_2]
-                else:
-                    idx_2 += 1
-            idx_1 += 1
+        components  = DisjointSet(len(chains))
+        owners      = {}                        # du node -> first chain containing it
 
-        for web in webs:
-            for chain in web.chains:
-                chain.web = web
+        for i, chain in enumerate(chains):
+            for node in chain.usages:
+                owner = owners.setdefault(node, i)
+                if owner != i:
+                    components.union(owner, i)
+
+        groups = {}
+        for i, chain in enumerate(chains):
+            groups.setdefault(components.find(i), []).append(chain)
+
+        return [Web(*group) for group in groups.values()]
 
-        return webs
+    @staticmethod
+    def chain_webs(webs: list):
+        """array: chain index -> index of its web in `webs`"""
+        size    = 1 + max((chain.index for web in webs for chain in web.chains), default=-1)
+        owners  = array('i', [-1]) * size
+        for i, web in enumerate(webs):
+            for chain in web.chains:
+                owners[chain.index] = i
+        return owners
 
     def __repr__(self):
         return f'<web {self.chains[0].symbol}:{len(self.chains)}>'
 
         
+class AdjacencyView(Mapping):
+    """
+        Read-only {web index: array of neighbours} view of an InterferenceGraph,
+        an array is built on the first access to its vertex
+    """
+    def __init__(self, graph):
+        self.graph  = graph
+        self.cache  = {}
+
+    def __getitem__(self, vertex):
+        if vertex not in self.cache:
+            self.cache[vertex] = self.graph.neighbours(vertex)
+        return self.cache[vertex]
+
+    def __iter__(self):
+        return iter(range(len(self.graph.mapping)))
+
+    def __len__(self):
+        return len(self.graph.mapping)
+
+
 class InterferenceGraph:
 
-    def __init__(self, root: DUNode, webs: list):
+    dense_threshold = 4096              # webs; a NumPy matrix is used from here if available
+
+    def __init__(self, graph: DUGraph, webs: list, dense=None, target=None):
+        """
+            Edges are kept in a bit matrix of `stride` bytes per web (bit j
+            of row i is set if webs i and j interfere), so adding and looking
+            up an edge touches one byte, or, when `dense` is set, in a NumPy
+            boolean matrix. By default the NumPy matrix is used for big
+            functions only. `target` gives the registers to colour with.
+        """
+        from target import Target
+
+        self.target = target or Target()
         inverse_mapping     = {i: web for i, web in enumerate(webs)}
-        node        = root
         mapping     = {web: i for i, web in enumerate(webs)}
-        adj_list    = {i: [] for i in inverse_mapping}
-        while node:
-            current_webs = set([chain.web for chain in node.chains])
-            for web_1 in current_webs:
-                for web_2 in current_webs:
-                    if web_1 == web_2:
-                        continue
-                    if mapping[web_2] not in adj_list[mapping[web_1]]:
-                        adj_list[mapping[web_1]].append(mapping[web_2])
-                        adj_list[mapping[web_2]].append(mapping[web_1])
-            node = node.left
 
+        if dense is None:
+            dense = numpy is not None and len(webs) >= InterferenceGraph.dense_threshold
+        elif dense and numpy is None:
+            raise ImportError('NumPy is required for a dense interference graph')
+
+        self.graph  = graph
         self.mapping = mapping
         self.inverse_mapping = inverse_mapping
-        self.adj_list = adj_list        
-
-
-    def colour(self):
-        colours = colour_graph(self.adj_list)
+        self.stride = (len(webs) + 7) >> 3
+        self.bits   = None if dense else bytearray(len(webs) * self.stride)
+        self.matrix = numpy.zeros((len(webs), len(webs)), dtype=bool) if dense else None
+
+        owners      = Web.chain_webs(webs)
+        previous    = set()                 # webs of the node before, a clique already
+        for node in range(len(graph)):
+            current_webs = {owners[chain_idx] for chain_idx in graph.live(node)}
+            if len(current_webs) > 1:
+                self.add_clique(current_webs, current_webs - previous)
+            previous = current_webs
+
+        if dense:
+            numpy.fill_diagonal(self.matrix, False)
+
+        self.adj_list = AdjacencyView(self)
+
+    def add_clique(self, vertices, new=None):
+        """
+            edges between all the `vertices`, only the ones from the `new`
+            vertices when the others are a clique already
+        """
+        new = vertices if new is None else new
+        if self.matrix is not None:
+            indices = numpy.fromiter(vertices, dtype=numpy.intp, count=len(vertices))
+            added   = numpy.fromiter(new, dtype=numpy.intp, count=len(new))
+            self.matrix[numpy.ix_(added, indices)] = True
+            self.matrix[numpy.ix_(indices, added)] = True
+            return
+        bits, stride = self.bits, self.stride
+        for vertex in new:
+            row, byte, bit = vertex * stride, vertex >> 3, 1 << (vertex & 7)
+            for other in vertices:
+                if other != vertex:
+                    bits[row + (other >> 3)]        |= 1 << (other & 7)
+                    bits[other * stride + byte]     |= bit
+
+    def add_edge(self, web_1: int, web_2: int):
+        if web_1 == web_2:
+            return
+        if self.matrix is not None:
+            self.matrix[web_1, web_2] = self.matrix[web_2, web_1] = True
+        else:
+            self.bits[web_1 * self.stride + (web_2 >> 3)] |= 1 << (web_2 & 7)
+            self.bits[web_2 * self.stride + (web_1 >> 3)] |= 1 << (web_1 & 7)
+        self.adj_list.cache.pop(web_1, None)
+        self.adj_list.cache.pop(web_2, None)
+
+    def interferes(self, web_1: int, web_2: int):
+        if self.matrix is not None:
+            return bool(self.matrix[web_1, web_2])
+        return bool(self.bits[web_1 * self.stride + (web_2 >> 3)] >> (web_2 & 7) & 1)
+
+    def row(self, web: int):
+        """the bit matrix row of `web` as an int bit-vector"""
+        start = web * self.stride
+        return int.from_bytes(self.bits[start:start + self.stride], 'little')
+
+    def neighbours(self, web: int):
+        if self.matrix is not None:
+            return array('i', numpy.flatnonzero(self.matrix[web]).tolist())
+        return array('i', iter_bits(self.row(web)))
+
+    def degree(self, web: int):
+        if self.matrix is not None:
+            return int(numpy.count_nonzero(self.matrix[web]))
+        return count_bits(self.row(web))
+
+    def edges(self):
+        return sum(self.degree(web) for web in self.inverse_mapping) // 2
+
+
+    def copies(self, graph: DUGraph, depths=None):
+        """
+            (source web, destination web) index pairs of `a = b` assignments,
+            the ones inside the deepest loops first
+        """
+        from tokens import Assign
+
+        usage_webs  = {}
+        def_webs    = {}
+        for web in self.inverse_mapping.values():
+            for chain in web.chains:
+                def_webs[chain.definition] = web
+                for node in chain.usages:
+                    usage_webs[node] = web
+
+        copies      = []
+        usage_nodes = {}                    # usage -> its du node
+        for node, du in enumerate(graph.du):
+            usage_nodes[du] = node
+            if type(du) == Definition and type(du.source) == Assign and len(du.source.du) == 2:
+                source = usage_webs.get(usage_nodes.get(du.source.du[0]))
+                if source is not None and source is not def_webs[du]:
+                    depth = depths.get(du.block, 0) if depths else 0
+                    copies.append((depth, self.mapping[source], self.mapping[def_webs[du]]))
+
+        copies.sort(key=lambda copy: copy[0], reverse=True)
+        return [(source, destination) for _, source, destination in copies]
+
+    def coalesce(self, copies: list):
+        """
+            Joins source and destination webs of the copies that don't
+            interfere if the Briggs or the George test says the graph stays
+            colourable with the real registers. Webs and edges are renumbered
+            afterwards, returns the number of removed moves.
+        """
+        k           = len(self.target.registers)
+        adjacency   = {web: set(self.adj_list[web]) for web in self.adj_list}
+        aliases     = DisjointSet(len(adjacency))
+        merged      = {web: self.inverse_mapping[web] for web in adjacency}
+        removed     = 0
+
+        def briggs(web_1, web_2):
+            neighbours = adjacency[web_1] | adjacency[web_2]
+            significant = [n for n in neighbours
+                           if len(adjacency[n]) - (n in adjacency[web_1] and n in adjacency[web_2]) >= k]
+            return len(significant) < k
+
+        def george(web_1, web_2):
+            return all(n in adjacency[web_1] or len(adjacency[n]) < k for n in adjacency[web_2])
+
+        for source, destination in copies:
+            web_1, web_2 = aliases.find(source), aliases.find(destination)
+            if web_1 == web_2:
+                removed += 1
+                continue
+            if web_2 in adjacency[web_1]:
+                continue
+            if not (briggs(web_1, web_2) or george(web_1, web_2) or george(web_2, web_1)):
+                continue
+
+            root    = aliases.union(web_1, web_2)
+            other   = web_2 if root == web_1 else web_1
+            for neighbour in adjacency.pop(other):
+                adjacency[neighbour].discard(other)
+                adjacency[neighbour].add(root)
+                adjacency[root].add(neighbour)
+            merged[root] = merged[root] + merged.pop(other)
+            removed += 1
+
+        webs = [merged[web] for web in sorted(merged)]
+        index = {old: new for new, old in enumerate(sorted(merged))}
+        self.set_edges(webs, {index[web]: [index[n] for n in adjacency[web]] for web in adjacency})
+
+        return removed
+
+    def set_edges(self, webs: list, adjacency: dict):
+        self.mapping            = {web: i for i, web in enumerate(webs)}
+        self.inverse_mapping    = {i: web for i, web in enumerate(webs)}
+        if self.matrix is not None:
+            self.matrix = None              # the old matrix goes before the new one is allocated
+            self.matrix = numpy.zeros((len(webs), len(webs)), dtype=bool)
+        else:
+            self.stride = (len(webs) + 7) >> 3
+            self.bits   = bytearray(len(webs) * self.stride)
+        for web, neighbours in adjacency.items():
+            for neighbour in neighbours:
+                self.add_edge(web, neighbour)
+        self.adj_list = AdjacencyView(self)
+
+    def colour(self, allocator='greedy', depths=None, constraints=None):
+        """
+            allocator:  'greedy' - greedy colouring, colours are ranked by the
+                                   number of nodes of their webs
+                        'briggs' - simplify/select colouring for the real
+                                   registers with spill costs weighted by loop
+                                   depth (depths is {BasicBlock: depth})
+            constraints are {DUChain: registers it can't be in} of Target.constraints,
+            a colour gets a register none of its webs is kept out of
+        """
+        k = len(self.target.registers)
+
+        if allocator == 'briggs':
+            colours = colour_graph_briggs(self.adj_list, k, self.spill_costs(depths or {}))
+        elif allocator == 'greedy':
+            colours = colour_graph(self.adj_list)
+        else:
+            raise ValueError(f'Unknown allocator: {allocator}')
         
-        colour_lists = {colour: [chain for chain in colours.keys() if colours[chain] == colour]
-                            for colour in colours.values()}
-        priorities = sorted(colour_lists.keys(),
-                            key = lambda colour: sum([len(self.inverse_mapping[i].nodes) + 1 for i in colour_lists[colour]]),
-                            reverse=True)
-
-        registers = ['ebx', 'ecx', 'edx'] + [f's{i}' for i in range(len(colour_lists.keys()) - 3)]
+        colour_lists = {}
+        for web_idx, colour in colours.items():
+            colour_lists.setdefault(colour, []).append(web_idx)
+
+        if allocator == 'briggs':
+            priorities = sorted(colour_lists.keys())    # real registers first
+        else:
+            priorities = sorted(colour_lists.keys(),
+                                key = lambda colour: sum([len(self.inverse_mapping[i].nodes) + 1 for i in colour_lists[colour]]),
+                                reverse=True)
+
+        webs        = [self.inverse_mapping[i] for i in range(len(self.inverse_mapping))]
+        forbidden   = {}
+        for web_idx, registers in self.target.forbidden(webs, constraints or {}).items():
+            forbidden.setdefault(colours[web_idx], set()).update(registers)
+        registers   = self.target.assign(priorities, forbidden)
 
         return colour_lists, priorities, registers
 
+    # every definition and usage costs 10 ** (loop depth)
+    def spill_costs(self, depths: dict):
+        costs   = {}
+        dus     = self.graph.du
+        for web_idx, web in self.inverse_mapping.items():
+            costs[web_idx] = 0
+            for node in web.nodes:
+                costs[web_idx] += 10 ** depths.get(dus[node].block, 0)
+        return costs
+
     def allocate(self, colour_lists, priorities, registers):
         for i in range(len(priorities)):
             colour      = priorities[i]
@@ -206,4 +636,4 @@ class InterferenceGraph:
                 web         = self.inverse_mapping[web_idx]
                 for chain in web.chains:
                     chain.definition.expression.register.name = register
-                    chain.definition.expression.register.real = register[0] == 'e'
+                    chain.definition.expression.register.real = register in self.target.registers
@@ -0,0 +1,226 @@
+import re
+from instructions import Instruction, Label, jumps, is_register, is_memory, is_immediate
+
+TEMP = 'dword [__temp]'
+
+
+def writes(instruction, operand):
+    """does the instruction change `operand` (flags aside)"""
+    if type(instruction) != Instruction:
+        return False
+    opcode, operands = instruction.opcode, instruction.operands
+    if opcode in ('IMUL', 'IDIV'):
+        return operand in ('eax', 'edx')
+    if opcode == 'CDQ':
+        return operand == 'edx'
+    if opcode == 'XCHG':
+        return operand in operands
+    if opcode in ('MOV', 'ADD', 'SUB', 'XOR', 'POP', 'AND', 'SHL', 'SAR', 'SHR', 'NEG', 'LEA'):
+        return operands[0] == operand
+    return False
+
+
+def reads(instruction, operand):
+    if type(instruction) != Instruction:
+        return False
+    opcode, operands = instruction.opcode, instruction.operands
+    if opcode in ('IMUL', 'IDIV') and operand == 'eax':
+        return True
+    if opcode == 'IDIV' and operand == 'edx':
+        return True
+    if opcode == 'CDQ':
+        return operand == 'eax'
+    if opcode == 'MOV':
+        return operands[1] == operand
+    if opcode == 'POP':
+        return False
+    if opcode == 'XOR' and operands[0] == operands[1]:
+        return False
+    if opcode == 'LEA':                                 # only the registers of the address
+        return operand in re.findall(r'\w+', operands[1])
+    return operand in operands
+
+
+def flow_breaks(instruction):
+    return type(instruction) == Label or instruction.opcode in jumps or instruction.opcode == 'RET'
+
+
+def temp_is_dead(code, start):
+    """
+        __temp is written again before anything reads it after `start`;
+        it never lives across statements, so a label or a jump ends it too
+    """
+    for instruction in code[start:]:
+        if reads(instruction, TEMP):
+            return False
+        if writes(instruction, TEMP) or flow_breaks(instruction):
+            return True
+    return True
+
+
+# every rule gets the code and a position, it returns the replacement of
+# code[i:i + window] or None when it doesn't apply. The window only
+# bounds what is replaced, a rule may look further ahead.
+
+def push_pop(code, i):
+    """PUSH x, POP y -> MOV y, x"""
+    push, pop = code[i], code[i + 1]
+    if push.opcode != 'PUSH' or pop.opcode != 'POP':
+        return None
+    source, target = push.operands[0], pop.operands[0]
+    if source == target:
+        return []
+    if is_memory(source) and is_memory(target):
+        return None
+    return [Instruction('MOV', target, source)]
+
+
+def self_move(code, i):
+    """MOV x, x"""
+    move = code[i]
+    if move.opcode == 'MOV' and move.operands[0] == move.operands[1]:
+        return []
+    return None
+
+
+def move_back(code, i):
+    """MOV a, b, MOV b, a -> MOV a, b"""
+    first, second = code[i], code[i + 1]
+    if first.opcode == 'MOV' and second.opcode == 'MOV' \
+            and first.operands == second.operands[::-1]:
+        return [first]
+    return None
+
+
+def dead_move(code, i):
+    """MOV r, x, MOV r, y -> MOV r, y when y doesn't read r"""
+    first, second = code[i], code[i + 1]
+    if first.opcode == 'MOV' and second.opcode == 'MOV' and is_register(first.operands[0]) \
+            and first.operands[0] == second.operands[0] and second.operands[1] != first.operands[0]:
+        return [second]
+    return None
+
+
+def zero_xor(code, i):
+    """MOV r, 0 -> XOR r, r, unless a conditional jump reads the flags before they are set again"""
+    move = code[i]
+    if move.opcode != 'MOV' or not is_register(move.operands[0]) or move.operands[1] != '0':
+        return None
+    for instruction in code[i + 1:]:
+        if instruction.opcode in jumps and instruction.opcode != 'JMP':
+            return None
+        if instruction.opcode in ('ADD', 'SUB', 'CMP', 'XOR', 'IMUL', 'IDIV') or flow_breaks(instruction):
+            break
+    return [Instruction('XOR', move.operands[0], move.operands[0])]
+
+
+def temp_forward(code, i):
+    """
+        MOV [__temp], x ... OP [__temp] -> ... OP x when x is a register
+        untouched in between (or an immediate OP accepts) and __temp is dead
+    """
+    store = code[i]
+    if store.opcode != 'MOV' or store.operands[0] != TEMP:
+        return None
+    value = store.operands[1]
+    if not (is_register(value) or is_immediate(value)):
+        return None
+    for j in range(i + 1, min(i + 4, len(code))):
+        instruction = code[j]
+        if flow_breaks(instruction):
+            return None
+        if reads(instruction, TEMP):
+            if not temp_is_dead(code, j + 1) or writes(instruction, TEMP):
+                return None
+            if is_immediate(value) and instruction.opcode not in ('ADD', 'SUB', 'CMP', 'MOV'):
+                return None
+            operands = [value if operand == TEMP else operand for operand in instruction.operands]
+            code[j]  = Instruction(instruction.opcode, *operands)
+            return []
+        if writes(instruction, value) or writes(instruction, TEMP):
+            return None
+    return None
+
+
+def temp_commute(code, i):
+    """
+        MOV [__temp], eax, MOV eax, y, ADD eax, [__temp] -> ADD eax, y
+        (and the same for the one operand IMUL) when __temp is dead,
+        a POP eax in the middle becomes POP [__temp]
+    """
+    store, load, operation = code[i], code[i + 1], code[i + 2]
+    if store.opcode != 'MOV' or store.operands != [TEMP, 'eax'] or not temp_is_dead(code, i + 3):
+        return None
+    if operation.operands not in (['eax', TEMP], [TEMP]) or operation.opcode not in ('ADD', 'IMUL'):
+        return None
+    if load.opcode == 'POP' and load.operands == ['eax']:
+        return [Instruction('POP', TEMP), operation]
+    if load.opcode != 'MOV' or load.operands[0] != 'eax' or load.operands[1] == TEMP:
+        return None
+    value = load.operands[1]
+    if operation.opcode == 'ADD':
+        return [Instruction('ADD', 'eax', value)]
+    if is_immediate(value):
+        return None
+    return [Instruction('IMUL', value)]
+
+
+def accumulate(code, i):
+    """MOV eax, r, OP eax, x, MOV r, eax -> OP r, x, MOV eax, r"""
+    load, operation, store = code[i], code[i + 1], code[i + 2]
+    if load.opcode != 'MOV' or load.operands[0] != 'eax' or store.opcode != 'MOV' \
+            or operation.opcode not in ('ADD', 'SUB') or operation.operands[0] != 'eax':
+        return None
+    target, value = load.operands[1], operation.operands[1]
+    if store.operands != [target, 'eax'] or value == 'eax' or is_immediate(target) \
+            or is_memory(target) and is_memory(value):
+        return None
+    return [Instruction(operation.opcode, target, value), Instruction('MOV', 'eax', target)]
+
+
+def jump_next(code, i):
+    """a jump to the label right after it"""
+    jump, label = code[i], code[i + 1]
+    if jump.opcode in jumps and type(label) == Label and jump.operands[0] == label.name:
+        return [label]
+    return None
+
+
+# name -> (window, rule)
+RULES = {
+    'push-pop':     (2, push_pop),
+    'self-move':    (1, self_move),
+    'move-back':    (2, move_back),
+    'dead-move':    (2, dead_move),
+    'temp-forward': (1, temp_forward),
+    'temp-commute': (3, temp_commute),
+    'accumulate':   (3, accumulate),
+    'jump-next':    (2, jump_next),
+    'zero-xor':     (1, zero_xor),
+}
+
+
+def optimize(code, rules=RULES):
+    """
+        Slides a window over the instruction list and applies the first
+        matching rule until none matches. Returns the new list and
+        {rule name: times it fired}.
+    """
+    code    = list(code)
+    fired   = dict.fromkeys(rules, 0)
+    largest = max(window for window, _ in rules.values())
+    i       = 0
+    while i < len(code):
+        for name, (window, rule) in rules.items():
+            if i + window > len(code):
+                continue
+            replacement = rule(code, i)
+            if replacement is None:
+                continue
+            code[i:i + window] = replacement
+            fired[name] += 1
+            i = max(i - largest, 0)
+            break
+        else:
+            i += 1
+    return code, {name: count for name, count in fired.items() if count}
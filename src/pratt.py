@@ -0,0 +1,245 @@
+import re
+from nametable import Int, Const, ParsingError, UnknownIDException
+from tokens import Integer, Assign, ADD, SUB, MUL, DIV, RET, Condition, START_WHILE, MID_WHILE, END_WHILE
+from operation_utils import BasicBlock
+
+
+class SyntaxException(ParsingError):
+    def __init__(self, line, column, message):
+        self.line       = line
+        self.column     = column
+        self.message    = f'line {line}:{column} {message}'
+
+
+# the longest match wins like in the ANTLR lexer, '-1' is a LITERAL and 'a-1' is an ID and a LITERAL
+TOKEN       = re.compile(r'(?P<WS>[ \r\n\t]+)|(?P<LITERAL>-?[0-9]+)|(?P<ID>[a-zA-Z][a-zA-Z0-9]*)'
+                         r'|(?P<PUNCTUATION><=|>=|==|!=|[-+*/(){}<>;,=])')
+KEYWORDS    = {'int', 'const', 'while', 'return'}
+
+
+def tokenize(text):
+    """[(kind, text, line, column)], kind is the text itself for keywords and punctuation"""
+    tokens      = []
+    line, start = 1, 0                      # start: position the current line begins at
+    position    = 0
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise SyntaxException(line, position - start, f"token recognition error at: '{text[position]}'")
+        kind, value = match.lastgroup, match.group()
+        if kind == 'WS':
+            newlines = value.count('\n')
+            if newlines:
+                line    += newlines
+                start   = position + value.rindex('\n') + 1
+        else:
+            if kind == 'PUNCTUATION' or kind == 'ID' and value in KEYWORDS:
+                kind = value
+            tokens.append((kind, value, line, position - start))
+        position = match.end()
+    tokens.append(('EOF', '<EOF>', line, position - start))
+    return tokens
+
+
+class PrattParser:
+    """
+        Recursive descent over the C.g4 subset without the ANTLR runtime,
+        expressions are parsed by precedence climbing with the precedence
+        levels ANTLR gives the alternatives of `expr`. It builds the same
+        operations, blocks and symbol table entries as the actions of the
+        grammar, in the same order, so the code generated is the same.
+    """
+
+    binary      = {'*': (6, MUL), '/': (6, DIV), '+': (5, ADD), '-': (5, SUB)}
+    assignment  = 4                         # `ID '=' expr` parses its expression at this level
+    jumps       = {'<': 'jge', '<=': 'jg', '>': 'jle', '>=': 'jl', '==': 'jne', '!=': 'je'}   # inverted
+
+    def __init__(self, text, context):
+        self.tokens     = tokenize(text)
+        self.position   = 0
+        self.context    = context
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)][0]
+
+    def next(self):
+        token = self.tokens[self.position]
+        if token[0] != 'EOF':
+            self.position += 1
+        return token
+
+    def expect(self, kind):
+        token = self.next()
+        if token[0] != kind:
+            raise SyntaxException(token[2], token[3], f"mismatched input '{token[1]}' expecting {kind}")
+        return token
+
+    def texts(self, start):
+        """texts of the tokens from `start` to the current one"""
+        return [token[1] for token in self.tokens[start:self.position]]
+
+    def source_code(self):
+        while self.peek() == 'const' or self.peek() == 'int' and self.peek(2) != '(':
+            start = self.position
+            if self.peek() == 'const' or self.peek(1) == 'const':
+                self.const_declaration()
+            else:
+                self.variable_declaration()
+            self.context.declaration(self.texts(start))
+        self.function_declaration()
+        while self.peek() != 'EOF':
+            self.function_declaration()
+
+    def function_declaration(self):
+        start = self.position
+        self.expect('int')
+        name = self.expect('ID')[1]
+        self.expect('(')
+        self.expect(')')
+        self.context.begin_function(name)
+        self.body()
+        self.context.end_function(self.texts(start))
+
+    def body(self):
+        self.context.name_table.push_scope()
+        self.expect('{')
+        while self.peek() != '}':
+            if self.peek() == 'while':
+                self.while_loop(self.context.loop_id)
+            elif self.peek() == 'const' or self.peek() == 'int' and self.peek(1) == 'const':
+                self.const_declaration()
+            elif self.peek() == 'int':
+                self.variable_declaration()
+            else:
+                self.expr()
+                self.expect(';')
+        self.expect('}')
+        self.context.name_table.pop_scope()
+
+    def variable_declaration(self):
+        context = self.context
+        self.expect('int')
+        while True:
+            name        = self.expect('ID')[1]
+            expr_val    = None
+            if self.peek() == '=':
+                self.next()
+                expr_val, _, _ = self.expr()
+            context.name_table[name] = Int(name)
+            if expr_val is not None:
+                context.operations.append(Assign(context.name_table[name].var, expr_val, context.eax))
+            if self.peek() != ',':
+                break
+            self.next()
+        self.expect(';')
+
+    def const_declaration(self):
+        if self.peek() == 'const':
+            self.next()
+            self.expect('int')
+        else:
+            self.expect('int')
+            self.expect('const')
+        name = self.expect('ID')[1]
+        self.expect('=')
+        value = Integer(int(self.expect('LITERAL')[1]))
+        self.expect(';')
+        self.context.name_table[name] = Const(name, value)
+
+    def while_loop(self, loop_id):
+        context = self.context
+        context.loops += 1
+
+        new_block_0 = BasicBlock(context.flow_graph[-1:])
+        context.flow_graph[-1].left = new_block_0
+        context.flow_graph.append(new_block_0)
+        new_block_0.add(START_WHILE(loop_id))
+
+        new_block_1 = BasicBlock([new_block_0])
+        new_block_0.left    = new_block_1
+        context.operations  = new_block_0.operations
+
+        self.expect('while')
+        self.expect('(')
+        jmp = self.condition()
+        self.expect(')')
+        context.operations.append(MID_WHILE(loop_id, jmp))
+        context.flow_graph.append(new_block_1)
+        context.operations = new_block_1.operations
+        self.body()
+
+        new_block_2 = BasicBlock([new_block_1])
+        new_block_0.right   = new_block_2           # leaving the loop
+        context.flow_graph[-1].left = new_block_2
+        context.flow_graph[-1].right = new_block_0  # the last block of the body jumps back
+        context.flow_graph[-1].add(END_WHILE(loop_id))
+        context.flow_graph.append(new_block_2)
+        context.operations = context.flow_graph[-1].operations
+
+    def condition(self):
+        left, _, _ = self.expr()
+        token = self.next()
+        if token[0] not in PrattParser.jumps:
+            raise SyntaxException(token[2], token[3], f"no viable alternative at input '{token[1]}'")
+        right, _, _ = self.expr()
+        self.context.operations.append(Condition(left, right, self.context.eax))
+        return PrattParser.jumps[token[0]]
+
+    def expr(self, precedence=0):
+        """(value, simplex, is_literal) like the attributes of the `expr` rule"""
+        value, simplex, is_literal = self.primary()
+        while self.peek() in PrattParser.binary and PrattParser.binary[self.peek()][0] >= precedence:
+            level, cls = PrattParser.binary[self.next()[0]]
+            right, right_simplex, right_literal = self.expr(level + 1)
+            value.in_stack = not (simplex or right_simplex)
+            op = cls(value, right, self.context.eax)
+            self.context.operations.append(op)
+            value, simplex, is_literal = op, is_literal and right_literal, None
+        return value, simplex, is_literal
+
+    def primary(self):
+        context = self.context
+        token   = self.next()
+        kind    = token[0]
+        if kind == '(':
+            result = self.expr()
+            self.expect(')')
+            return result
+        if kind == 'return':
+            value, _, _ = self.expr()
+            context.operations.append(RET(value, context.eax))
+            return None, None, None
+        if kind == 'LITERAL':
+            return Integer(int(token[1])), True, True
+        if kind != 'ID':
+            raise SyntaxException(token[2], token[3], f"no viable alternative at input '{token[1]}'")
+
+        name = token[1]
+        if self.peek() == '=':
+            self.next()
+            value, _, _ = self.expr(PrattParser.assignment)
+            entity = context.name_table[name]
+            if entity is None or not entity.mutable:
+                raise UnknownIDException(name)
+            context.name_table.rewrite_var(name)
+            op = Assign(context.name_table[name].var, value, context.eax)
+            context.operations.append(op)
+            return op, True, None
+        if self.peek() == '(':                      # function call placeholder
+            self.next()
+            self.expr()
+            while self.peek() == ',':
+                self.next()
+                self.expr()
+            self.expect(')')
+            return None, None, None
+
+        entity = context.name_table[name]
+        if entity is None:
+            raise UnknownIDException(name)
+        return (entity.var if entity.mutable else entity.value), True, None
+
+
+def parse(text, context):
+    """fills the CompilationContext from the source text like CParser.source_code"""
+    PrattParser(text, context).source_code()
@@ -0,0 +1,85 @@
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:                         # not on Windows
+    resource = None
+
+
+class Profiler:
+    """
+        Wall time and peak memory (tracemalloc) of the compilation phases
+        plus counters of what the phases produced. A disabled profiler
+        records nothing and costs close to nothing.
+    """
+
+    def __init__(self, enabled=True, memory=True):
+        self.enabled    = enabled
+        self.memory     = memory            # tracemalloc slows the phases down, timings are cleaner without it
+        self.phases     = {}                # name -> {'seconds': float, 'peak_bytes': int}
+        self.counters   = {}                # name -> int
+        self.started    = False             # tracemalloc was started by this profiler
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        if not self.memory:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                record = self.phases.setdefault(name, {'seconds': 0.0})
+                record['seconds'] += time.perf_counter() - start
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started = True
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        start   = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            record  = self.phases.setdefault(name, {'seconds': 0.0, 'peak_bytes': 0})
+            record['seconds']    += seconds
+            record['peak_bytes']  = max(record['peak_bytes'], peak - base)
+
+    def count(self, name, value):
+        """counts of one name add up, every function of a file counts its own"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stop(self):
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def report(self, **fields):
+        return dict(fields, phases=self.phases, counters=self.counters,
+                    total_seconds=sum(record['seconds'] for record in self.phases.values()),
+                    peak_rss_bytes=Profiler.peak_rss())
+
+    @staticmethod
+    def peak_rss():
+        """peak resident set size of the whole process so far, None where it isn't known"""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024       # bytes on macOS, KB elsewhere
+
+    def dump(self, path=None, **fields):
+        """writes the report as a JSON line to `path` (appended) or to stderr"""
+        line = json.dumps(self.report(**fields))
+        if path is None or path == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(path, 'a') as output:
+                output.write(line + '\n')
@@ -0,0 +1,216 @@
+from tokens import Integer, Variable, Assign, AdditiveOperation, MultiplicativeOperation, ADD, MUL
+from operation_utils import BasicBlock, Definition, Usage
+from loop_invariants import loops, is_operation
+from instructions import Instruction
+
+
+def wrap(value):
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def multiply(factor):
+    """
+        instructions multiplying eax by a literal with shifts and LEA,
+        None when IMUL is cheaper
+    """
+    if factor == 0:
+        return [Instruction('MOV', 'eax', 0)]
+    code    = []
+    value   = abs(factor)
+    shift   = (value & -value).bit_length() - 1
+    odd     = value >> shift
+    if odd not in (1, 3, 5, 9):
+        return None
+    if odd != 1:
+        code.append(Instruction('LEA', 'eax', f'[eax+eax*{odd - 1}]'))
+    if shift:
+        code.append(Instruction('SHL', 'eax', shift))
+    if factor < 0:
+        code.append(Instruction('NEG', 'eax'))
+    return code
+
+
+def magic(divisor):
+    """
+        (multiplier, shift) of the signed division by a literal through the
+        high half of a product, Hacker's Delight 10-1
+    """
+    absolute    = abs(divisor)
+    t           = 2 ** 31 + (divisor < 0)
+    anc         = t - 1 - t % absolute
+    p           = 31
+    q1, r1      = divmod(2 ** 31, anc)
+    q2, r2      = divmod(2 ** 31, absolute)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= absolute:
+            q2, r2 = q2 + 1, r2 - absolute
+        delta = absolute - r2
+        if not (q1 < delta or q1 == delta and r1 == 0):
+            break
+    multiplier = q2 + 1
+    return wrap(-multiplier if divisor < 0 else multiplier), p - 32
+
+
+def divide(divisor):
+    """
+        instructions dividing eax by a literal (rounding towards zero like
+        IDIV) without IDIV. None for 0 and -1, those are left to fault. edx
+        is overwritten like by IDIV.
+    """
+    if divisor in (0, -1):
+        return None
+    if divisor == 1:
+        return []
+    absolute    = abs(divisor)
+    code        = []
+    if absolute & (absolute - 1) == 0:                          # 2 ** k, negatives are rounded up
+        shift = absolute.bit_length() - 1
+        code.append(Instruction('CDQ'))
+        if shift == 1:
+            code.append(Instruction('SUB', 'eax', 'edx'))
+        else:
+            code.append(Instruction('AND', 'edx', absolute - 1))
+            code.append(Instruction('ADD', 'eax', 'edx'))
+        code.append(Instruction('SAR', 'eax', shift))
+        if divisor < 0:
+            code.append(Instruction('NEG', 'eax'))
+        return code
+
+    multiplier, shift = magic(divisor)
+    code += [Instruction('MOV', 'dword [__temp]', 'eax'),
+             Instruction('MOV', 'eax', multiplier),
+             Instruction('IMUL', 'dword [__temp]')]             # edx = high half of the product
+    if divisor > 0 and multiplier < 0:
+        code.append(Instruction('ADD', 'edx', 'dword [__temp]'))
+    if divisor < 0 and multiplier > 0:
+        code.append(Instruction('SUB', 'edx', 'dword [__temp]'))
+    if shift:
+        code.append(Instruction('SAR', 'edx', shift))
+    code += [Instruction('MOV', 'eax', 'edx'),
+             Instruction('SHR', 'eax', 31),                     # +1 for a negative quotient
+             Instruction('ADD', 'eax', 'edx')]
+    return code
+
+
+class StrengthReduction:
+    """
+        Multiplications of a loop's induction variable by a literal become
+        a new variable kept equal to the product: it is computed in front of
+        the loop and increased with the induction variable. Then IMUL / IDIV
+        by a literal are lowered to shifts, LEA and multiplications by magic
+        numbers.
+    """
+
+    def __init__(self, flow_graph: list, eax):
+        self.flow_graph = flow_graph
+        self.eax        = eax
+        self.reduced    = 0                 # products replaced by an induction variable
+        self.lowered    = 0                 # IMUL / IDIV replaced by cheaper code
+
+    @staticmethod
+    def increment(op, name):
+        """the literal of `name = name + k` / `name = name - k`, None for anything else"""
+        if type(op) != Assign or not isinstance(op.right, AdditiveOperation):
+            return None
+        left, right = op.right.left, op.right.right
+        if type(left) == Integer and op.right.operation == 'ADD':
+            left, right = right, left
+        if type(left) != Variable or left.name != name or type(right) != Integer:
+            return None
+        return right._value if op.right.operation == 'ADD' else -right._value
+
+    @staticmethod
+    def product(op):
+        """(variable, factor) of a multiplication of a variable by a literal"""
+        if not isinstance(op, MultiplicativeOperation) or op.operation != 'IMUL':
+            return None
+        for variable, factor in ((op.left, op.right), (op.right, op.left)):
+            if type(variable) == Variable and type(factor) == Integer:
+                return variable, factor._value
+        return None
+
+    def reduce_loop(self, header, end):
+        blocks      = self.flow_graph[header:end + 1]
+        definitions = {}                    # name -> ops defining it in the loop
+        parents     = {}                    # operand -> (operation, attribute it is in)
+        for block in blocks:
+            for op in block.operations:
+                for du in op.du:
+                    if type(du) == Definition:
+                        definitions.setdefault(du.expression.name, []).append(op)
+                for attribute in ('left', 'right', 'expr'):
+                    child = getattr(op, attribute, None)
+                    if is_operation(child) or type(child) == Assign:
+                        parents[child] = (op, attribute)
+
+        induction = {}                      # name -> (its only definition, step)
+        for name, ops in definitions.items():
+            step = StrengthReduction.increment(ops[0], name) if len(ops) == 1 else None
+            if step is not None and ops[0] not in parents:
+                induction[name] = ops[0], step
+
+        products = {}                       # (name, factor) -> multiplications
+        for block in blocks:
+            for op in block.operations:
+                product = StrengthReduction.product(op)
+                if product and product[0].name in induction and op in parents:
+                    products.setdefault((product[0].name, product[1]), []).append(op)
+        if not products:
+            return
+
+        preheader = BasicBlock.insert_preheader(self.flow_graph, header)
+        for (name, factor), ops in products.items():
+            variable    = Variable(f'__induction_{self.reduced}')
+            first       = ops[0]
+            start       = MUL(first.left, first.right, self.eax)
+            preheader.add(start)
+            preheader.add(Assign(variable, start, self.eax))
+
+            definition, step = induction[name]
+            update      = ADD(variable, Integer(wrap(step * factor)), self.eax)
+            for block in blocks:
+                if definition in block.operations:
+                    position = block.operations.index(definition) + 1
+                    block.operations[position:position] = [update, Assign(variable, update, self.eax)]
+
+            for op in ops:
+                for block in blocks:
+                    if op in block.operations:
+                        block.operations.remove(op)
+                parent, attribute = parents[op]
+                setattr(parent, attribute, variable)
+                parent.du.append(Usage(variable, parent))
+                if attribute == 'right':
+                    parent.left.in_stack = False
+            self.reduced += 1
+
+    def lower(self):
+        for block in self.flow_graph:
+            for op in block.operations:
+                if not isinstance(op, MultiplicativeOperation) or type(op.left) == type(op.right) == Integer:
+                    continue
+                if op.operation == 'IMUL' and type(op.left) == Integer:
+                    op.left, op.right = op.right, op.left
+                if type(op.right) != Integer:
+                    continue
+                lowering = multiply(op.right._value) if op.operation == 'IMUL' else divide(op.right._value)
+                if lowering is not None:
+                    op.lowering = lowering
+                    self.lowered += 1
+
+    def run(self):
+        for header, end in loops(self.flow_graph):
+            self.reduce_loop(self.flow_graph.index(header), self.flow_graph.index(end))
+        self.lower()
+        return self.reduced, self.lowered
+
+
+def reduce_strength(flow_graph: list, eax):
+    """runs the pass in place, returns (products reduced, operations lowered)"""
+    return StrengthReduction(flow_graph, eax).run()
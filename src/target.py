@@ -0,0 +1,118 @@
+from tokens import Integer, MultiplicativeOperation
+from instructions import Instruction
+from peephole import writes
+
+
+class Target:
+    """
+        The registers webs may be allocated to, eax is never one of them:
+        every operation computes into it. IMUL and IDIV (and the code they
+        are lowered to) also write edx behind the allocator's back, so the
+        webs alive across them get constraints instead of the code saving
+        and restoring edx.
+    """
+
+    allocatable = ['ebx', 'ecx', 'edx', 'esi', 'edi']
+
+    def __init__(self, registers=None):
+        registers = list(registers or Target.allocatable)
+        unknown = [register for register in registers if register not in Target.allocatable]
+        if unknown or len(set(registers)) != len(registers) or not registers:
+            raise ValueError(f'Registers to allocate have to be distinct ones of '
+                             f'{", ".join(Target.allocatable)}: {", ".join(registers)}')
+        self.registers = registers
+
+    @staticmethod
+    def parse(text):
+        """Target of a comma separated register list, e.g. 'ebx,ecx,esi,edi'"""
+        return Target([register.strip() for register in text.split(',') if register.strip()])
+
+    def clobbered(self, op):
+        """allocatable registers the instructions of `op` write"""
+        if not isinstance(op, MultiplicativeOperation) or type(op.left) == type(op.right) == Integer:
+            return set()
+        code = op.lowering
+        if code is None:
+            code = [Instruction(op.operation, 'dword [__temp]')]
+        return {register for instruction in code for register in self.registers
+                if writes(instruction, register)}
+
+    def constraints(self, flow_graph: list, graph):
+        """
+            {DUChain: registers it can't be in}. The whole expression tree
+            around a clobbering operation counts: expression_order may compute
+            its operations in another order, so every variable the tree reads
+            is treated as alive across it, as is everything alive after it.
+        """
+        du_nodes = {}                       # operation -> its du nodes
+        for node, du in enumerate(graph.du):
+            du_nodes.setdefault(du.source, []).append(node)
+
+        next_nodes  = {}                    # operation -> first du node after it
+        following   = None
+        for block in reversed(flow_graph):
+            for op in reversed(block.operations):
+                next_nodes[op] = following
+                if op in du_nodes:
+                    following = du_nodes[op][0]
+
+        constraints = {}
+        for block in flow_graph:
+            operations  = set(block.operations)
+            roots       = {}                # operation -> root of its expression tree
+            for op in reversed(block.operations):       # parents follow their operands
+                roots.setdefault(op, op)
+                for attribute in ('left', 'right', 'expr'):
+                    child = getattr(op, attribute, None)
+                    if child in operations:
+                        roots[child] = roots[op]
+
+            clobbered = {}                  # root -> registers its tree writes
+            for op in block.operations:
+                registers = self.clobbered(op)
+                if registers:
+                    clobbered.setdefault(roots[op], set()).update(registers)
+
+            for tree_root, registers in clobbered.items():
+                nodes = [node for op in block.operations if roots[op] is tree_root
+                         for node in du_nodes.get(op, [])]
+                after = next_nodes[tree_root]
+                if after is not None:
+                    nodes.append(after)
+                for node in nodes:
+                    for chain in graph.chains_at(node):
+                        if chain.definition is not graph.du[node]:  # not alive before its definition
+                            constraints.setdefault(chain, set()).update(registers)
+        return constraints
+
+    @staticmethod
+    def forbidden(webs: list, constraints: dict):
+        """{web index: registers it can't be in}"""
+        forbidden = {}
+        for i, web in enumerate(webs):
+            registers = {register for chain in web.chains for register in constraints.get(chain, ())}
+            if registers:
+                forbidden[i] = registers
+        return forbidden
+
+    def assign(self, priorities: list, forbidden: dict):
+        """
+            registers for the colours in the order of priorities, `forbidden`
+            is {colour: registers}. A colour takes the allowed register the
+            other colours can least use, memory slots follow once none is left.
+        """
+        demand      = {register: sum(register in registers for registers in forbidden.values())
+                       for register in self.registers}
+        free        = list(self.registers)
+        registers   = []
+        slots       = 0
+        for colour in priorities:
+            allowed = [register for register in free if register not in forbidden.get(colour, ())]
+            if allowed:
+                register = max(allowed, key=lambda register: demand[register])
+                free.remove(register)
+                registers.append(register)
+            else:
+                registers.append(f's{slots}')
+                slots += 1
+        return registers
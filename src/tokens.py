@@ -1,6 +1,8 @@
 from operation_utils import Definition, Usage
+from instructions import Instruction, Label, render
 
 class Register:
+    __slots__ = ('name', 'real')
 
     def __init__(self, real=False, name=''):
         self.name   = name
@@ -15,6 +17,7 @@ class Register:
 
 
 class EAX(Register):
+    __slots__ = ()
 
     def __init__(self):
         super().__init__(True, 'eax')
@@ -24,22 +27,42 @@ class EAX(Register):
     
 
 class Expression:
+    __slots__ = ('value', 'register', 'evaluated', 'in_stack', 'temp')
 
     def __init__(self):
         self.value      = None
         self.register   = Register()
         self.evaluated  = False
         self.in_stack   = False
+        self.temp       = None              # register holding the result for the parent
     
+    @property
+    def instructions(self):
+        return []
+
     @property
     def code(self):
-        return ''
+        return render(self.instructions)
+
+    # instructions keeping the result (computed into eax) until the parent uses it
+    @property
+    def save(self):
+        if self.in_stack:
+            return [Instruction('PUSH', 'eax')]
+        if self.temp:
+            return [Instruction('MOV', self.temp, 'eax')]
+        return []
+
+    @property
+    def saved(self):
+        return self.in_stack or self.temp is not None
 
     def __repr__(self):
         return repr(self.value)
 
 
 class Integer(Expression):
+    __slots__ = ('_value',)
 
     def __init__(self, value):
         super().__init__()
@@ -55,14 +78,16 @@ class Integer(Expression):
     def __mul__(self, other):
         return self._value * other._value
 
-    def __div__(self, other):
-        return self._value // other._value
+    def __floordiv__(self, other):                          # rounds towards zero like IDIV
+        quotient = abs(self._value) // abs(other._value)
+        return quotient if (self._value < 0) == (other._value < 0) else -quotient
     
     def __repr__(self):
         return f'{self._value}'
 
 
 class Variable(Expression):
+    __slots__ = ('name',)
 
     def __init__(self, name):
         super().__init__()
@@ -75,6 +100,7 @@ class Variable(Expression):
 
 
 class BinaryOperation(Expression):
+    __slots__ = ('eax', 'left', 'right', 'du')
 
     def __init__(self, left, right, eax=None):
         super().__init__()
@@ -87,17 +113,19 @@ class BinaryOperation(Expression):
 
 # is used in EAX and DIV
 class MOV(BinaryOperation):
+    __slots__ = ()
 
     def __init__(self, left, right):
         super().__init__(left, right)
         self.value  = left.value
 
     @property
-    def code(self):
-        return f'\tMOV {self.left},\t{self.right}\n' if self.left != self.right else ''
+    def instructions(self):
+        return [Instruction('MOV', self.left, self.right)] if self.left != self.right else []
 
 
 class Assign(BinaryOperation):
+    __slots__ = ()
 
     def __init__(self, left, right, eax):
         super().__init__(left, right, eax)
@@ -114,26 +142,24 @@ class Assign(BinaryOperation):
         self.du.append(Definition(left, self))
 
     @property
-    def code(self):
+    def instructions(self):
+
+        if repr(self.left) == repr(self.right.value):           # coalesced copy
+            return []
 
-        code = ''
-        
         if self.left.real \
              or type(self.right) == Integer \
              or self.right.value.real:                          # r, *  |  m, r/int
-            code = f'\tMOV {self.left},\t{self.right}\n\n'
+            return [Instruction('MOV', self.left, self.right)]
 
-        else:                                                   # both are symbolic (m, m)
-            mov    =  self.eax.load(self.right.value)
-            code   += mov.code
-            code   += f'\tMOV {self.left},\t{self.eax}\n\n'
-
-        return code
+        # both are symbolic (m, m)
+        return self.eax.load(self.right.value).instructions + [Instruction('MOV', self.left, self.eax)]
 
 
 # r, r/m/int
 # m, r/int
 class AdditiveOperation(BinaryOperation):
+    __slots__ = ('operation',)
 
     def __init__(self, operation, left, right, eax):
         super().__init__(left, right, eax)
@@ -150,45 +176,67 @@ class AdditiveOperation(BinaryOperation):
             self.du.append(Usage(right, self))
 
     @property
-    def code(self):
+    def instructions(self):
 
         if type(self.left) == Integer and type(self.right) == Integer:
-            return ''
+            return []
 
         right = self.right.value
-        code = ''
+        code = []
+
+        if self.right.saved:                                    # right was computed first, left is in eax
+            if self.right.in_stack:
+                code.append(Instruction('POP', 'dword [__temp]'))
+                right = 'dword [__temp]'
+            else:
+                right = self.right.temp
+            code.append(Instruction(self.operation, 'eax', right))
+            return code + self.save
+
+        if self.left.temp:                                      # left is in a register, right is in eax
+            if self.operation == 'ADD':
+                code.append(Instruction('ADD', 'eax', self.left.temp))
+            else:
+                code.append(Instruction('SUB', self.left.temp, 'eax'))
+                code.append(Instruction('MOV', 'eax', self.left.temp))
+            return code + self.save
+
         if right == self.eax:
-            code = f'\tMOV dword [__temp], {right}\n'
+            code = [Instruction('MOV', 'dword [__temp]', right)]
             right = 'dword [__temp]'
         
         if self.left.in_stack:
-            code += '\tPOP eax\n'
+            code.append(Instruction('POP', 'eax'))
         elif self.left != self.eax:
-            code += self.eax.load(self.left.value).code
+            code += self.eax.load(self.left.value).instructions
 
-        code += f'\t{self.operation} eax,\t{right}\n'
-        code += '\tPUSH eax\n' if self.in_stack else '\n'
+        code.append(Instruction(self.operation, 'eax', right))
+        code += self.save
 
         return code
 
 
 class ADD(AdditiveOperation):
+    __slots__ = ()
 
     def __init__(self, left, right, eax):
         super().__init__('ADD', left, right, eax)
 
 
 class SUB(AdditiveOperation):
+    __slots__ = ()
 
     def __init__(self, left, right, eax):
         super().__init__('SUB', left, right, eax)
 
 # r/m
 class MultiplicativeOperation(BinaryOperation):
+    __slots__ = ('operation', 'lowering')
 
     def __init__(self, operation, left, right, eax):
         super().__init__(left, right, eax)
         self.operation = operation
+        self.lowering  = None               # instructions replacing IMUL / IDIV by a literal, see strength_reduction
 
         if type(left) == Integer and type(right) == Integer:
             self.value = left * right if operation == 'IMUL' else left // right
@@ -201,47 +249,64 @@ class MultiplicativeOperation(BinaryOperation):
             self.du.append(Usage(right, self))
 
     @property
-    def code(self):
+    def instructions(self):
 
         if type(self.left) == Integer and type(self.right) == Integer:
-            return ''
+            return []
         
-        code = ''
+        code = []
 
         right = self.right.value
-        if right == self.eax or type(right) == Integer:
-            code = f'\tMOV dword [__temp], {right}\n'
-            right = '\tdword [__temp]\n'
-        
-        if self.left.in_stack:
-            code += '\tPOP eax\n'
-        elif self.left.value != self.eax:
-            code += self.eax.load(self.left.value).code
+        if self.right.saved:                                    # right was computed first, left is in eax
+            if self.right.in_stack:
+                code.append(Instruction('POP', 'dword [__temp]'))
+                right = 'dword [__temp]'
+            else:
+                right = self.right.temp
 
-        if self.operation == 'IDIV':
-            code += '\tPUSH edx\n'
-            code += '\tXOR edx, edx\n'
+        elif self.left.temp:                                    # left is in a register, right is in eax
+            right = self.left.temp
+            if self.operation == 'IDIV':
+                code.append(Instruction('XCHG', 'eax', right))
 
-        code += f'\t{self.operation} {right}\n'
-        
-        if self.operation == 'DIV':
-            code += '\tPOP edx\n'
-        code += '\tPUSH eax\n' if self.in_stack else '\n'
+        else:
+            if self.lowering is None and (right == self.eax or type(right) in (Integer, int)):
+                code = [Instruction('MOV', 'dword [__temp]', right)]
+                right = 'dword [__temp]'
+            
+            if self.left.in_stack:
+                code.append(Instruction('POP', 'eax'))
+            elif self.left.value != self.eax:
+                code += self.eax.load(self.left.value).instructions
+
+            if self.lowering is not None:                       # left is in eax, right is a literal
+                return code + self.lowering + self.save
+
+        if self.operation == 'IDIV':                            # nothing alive is kept in edx, see target
+            code.append(Instruction('CDQ'))                     # sign-extends eax into edx
+
+        code.append(Instruction(self.operation, right))
+        code += self.save
 
         return code
 
 
 class MUL(MultiplicativeOperation):
+    __slots__ = ()
+
     def __init__(self, left, right, eax):
         super().__init__('IMUL', left, right, eax)
 
 
 class DIV(MultiplicativeOperation):
+    __slots__ = ()
+
     def __init__(self, left, right, eax):
         super().__init__('IDIV', left, right, eax)
 
 
 class RET(Expression):
+    __slots__ = ('expr', 'eax', 'du')
 
     def __init__(self, expr, eax):
         self.expr   = expr
@@ -253,17 +318,17 @@ class RET(Expression):
             self.du.append(Usage(expr, self))
 
     @property
-    def code(self):
-        code = '\tPOP eax\n' if self.expr.in_stack else '' 
+    def instructions(self):
+        code = [Instruction('POP', 'eax')] if self.expr.in_stack else []
         if self.expr.value != self.eax:            
-            mov   = self.eax.load(self.expr.value)
-            code   += mov.code
-        code       += f'\tRET\n'
+            code += self.eax.load(self.expr.value).instructions
+        code.append(Instruction('RET'))
 
         return code
 
 
 class Condition(BinaryOperation):
+    __slots__ = ()
 
     def __init__(self, left, right, eax):
         super().__init__(left, right, eax)
@@ -275,33 +340,45 @@ class Condition(BinaryOperation):
             self.du.append(Usage(right, self))
 
     @property
-    def code(self):
+    def instructions(self):
 
-        code    = ''
+        code    = []
         right   = self.right.value
         left    = self.left.value
+
+        if self.right.saved:                                    # right was computed first, left is in eax
+            if self.right.in_stack:
+                code.append(Instruction('POP', 'dword [__temp]'))
+                right = 'dword [__temp]'
+            else:
+                right = self.right.temp
+            code.append(Instruction('CMP', 'eax', right))
+            return code
+
+        if self.left.temp:                                      # left is in a register, right is in eax
+            code.append(Instruction('CMP', self.left.temp, 'eax'))
+            return code
         
         if self.left.in_stack:
             if right == self.eax:
-                code += f'\tMOV dword [__temp], {right}\n'
+                code.append(Instruction('MOV', 'dword [__temp]', right))
                 right = 'dword [__temp]'
-            code += '\tPOP eax\n'
-            left = self.eax
-            code += f'\tCMP eax,\t{right}\n\n'
+            code.append(Instruction('POP', 'eax'))
+            code.append(Instruction('CMP', 'eax', right))
             return code
         
         if left != self.eax:
             if right == self.eax:
-                code += f'\tMOV dword [__temp], {right}\n'
+                code.append(Instruction('MOV', 'dword [__temp]', right))
                 right = 'dword [__temp]'
-            mov         = self.eax.load(left)
-            code   += mov.code
+            code += self.eax.load(left).instructions
         
-        code += f'\tCMP eax,\t{right}\n\n'
+        code.append(Instruction('CMP', 'eax', right))
         return code
 
 
 class START_WHILE(Expression):
+    __slots__ = ('loop_id', 'du')
 
     def __init__(self, loop_id):
         self.loop_id    = loop_id
@@ -309,11 +386,12 @@ class START_WHILE(Expression):
         self.value      = None
     
     @property
-    def code(self):
-        return f'\twhile_{self.loop_id}:\n\n'
+    def instructions(self):
+        return [Label(f'while_{self.loop_id}')]
 
 
 class MID_WHILE(Expression):
+    __slots__ = ('jmp', 'loop_id', 'du')
 
     def __init__(self, loop_id, jmp):
         self.jmp        = jmp
@@ -322,10 +400,11 @@ class MID_WHILE(Expression):
         self.value      = None
         
     @property
-    def code(self):
-        return f'\t{self.jmp} end_while_{self.loop_id}\n\n'
+    def instructions(self):
+        return [Instruction(self.jmp, f'end_while_{self.loop_id}')]
 
 class END_WHILE(Expression):
+    __slots__ = ('loop_id', 'du')
 
     def __init__(self, loop_id):
         self.loop_id    = loop_id
@@ -333,5 +412,5 @@ class END_WHILE(Expression):
         self.value      = None
     
     @property
-    def code(self):
-        return f'\tjmp while_{self.loop_id}\n\tend_while_{self.loop_id}:\n\n'
+    def instructions(self):
+        return [Instruction('JMP', f'while_{self.loop_id}'), Label(f'end_while_{self.loop_id}')]
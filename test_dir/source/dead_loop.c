@@ -0,0 +1,11 @@
+int main() {
+    int n = 0;
+    int i = 0;
+    while (i > 5) {
+        n = n + 1;
+    }
+    while (n < 3) {
+        n = n + 1;
+    }
+    return n;
+}